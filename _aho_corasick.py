@@ -0,0 +1,85 @@
+#! /usr/bin/python3
+
+
+"""
+Aho-Corasick automaton for the -w word list.
+
+All substrings are compiled into one automaton, so every message is scanned
+a single time no matter how many substrings are tracked. The transitions are
+precomputed for every character of the word list, any other character leads
+back to the root state, which makes each step a single dict lookup.
+
+Hits are counted like str.count() counts them: occurrences of the same
+substring do not overlap, occurrences of different substrings can.
+"""
+
+
+"""
+@input  patterns  (list)  substrings to search for, empty ones are ignored
+@output automaton (dict)
+"""
+
+
+def build_automaton(patterns):
+    goto = [{}]
+    output = [[]]
+    for index, pattern in enumerate(patterns):
+        if len(pattern) == 0:
+            continue
+        state = 0
+        for char in pattern:
+            if char not in goto[state]:
+                goto[state][char] = len(goto)
+                goto.append({})
+                output.append([])
+            state = goto[state][char]
+        output[state].append(index)
+
+    # breadth first: the fail state of a state is always closer to the root
+    fail = [0] * len(goto)
+    delta = [dict(goto[0])]  # complete transitions, missing chars go to the root
+    delta.extend({} for _ in range(len(goto) - 1))
+    queue = list(goto[0].values())
+    for state in queue:
+        output[state] = output[state] + output[fail[state]]
+        delta[state] = dict(delta[fail[state]])
+        delta[state].update(goto[state])
+        for char, child in goto[state].items():
+            fail[child] = delta[fail[state]].get(char, 0)
+            queue.append(child)
+
+    automaton = {}
+    automaton["patterns"] = list(patterns)
+    automaton["lengths"] = [len(pattern) for pattern in patterns]
+    automaton["delta"] = delta
+    automaton["output"] = output
+    return automaton
+
+
+"""
+@input  automaton (dict)  output of build_automaton
+@input  text      (str)   already lowercased
+@input  counts    (list)  hits per pattern, updated in place
+@output hits      (int)   total hits in this text
+"""
+
+
+def count_matches(automaton, text, counts):
+    delta = automaton["delta"]
+    output = automaton["output"]
+    lengths = automaton["lengths"]
+    last_end = {}
+    hits = 0
+    state = 0
+    position = 0
+    for char in text:
+        position += 1
+        state = delta[state].get(char, 0)
+        if output[state]:
+            for index in output[state]:
+                # str.count does not count overlapping occurrences
+                if position - lengths[index] >= last_end.get(index, 0):
+                    last_end[index] = position
+                    counts[index] += 1
+                    hits += 1
+    return hits
@@ -0,0 +1,255 @@
+#! /usr/bin/python3
+
+import hashlib
+import json
+import os
+import re
+import zipfile
+import numpy as np
+
+from _message_table import COLUMNS
+
+
+"""
+On-disk cache of parsed chats.
+
+Decoding a large result.json takes most of the runtime, although it only
+changes when the chats are exported again. The table of every analyzed chat
+(see _message_table) is therefore stored as a .npz file, keyed by the
+fingerprint of the export, and later runs with other options (-d, -w, ...)
+load the table instead of parsing the json again.
+
+    <cache_dir>/<key>.json              index: source path, headers of the cached chats
+    <cache_dir>/<key>_<chat id>.npz     one table per chat
+
+The key changes as soon as the export file changes, the entries of an older
+version of the same file are removed when a new one is written. The oldest
+entries (by last use) are evicted when the cache grows beyond its size cap.
+"""
+
+CACHE_VERSION = 1
+SAMPLE_SIZE = 1 << 20
+
+_index_name = re.compile(r"([0-9a-f]{20})\.json")
+_entry_name = re.compile(r"([0-9a-f]{20})(?:_[^/]+\.npz|\.json\.tmp)")
+
+
+"""
+@input  path (str)
+@output key  (str)   changes with the size, the mtime and the content of the file
+
+Only the first and the last megabyte are hashed, reading the whole export
+would cost as much as parsing it.
+"""
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    digest.update(
+        (str(CACHE_VERSION) + ":" + str(stat.st_size) + ":" + str(stat.st_mtime_ns)).encode()
+    )
+    with open(path, "rb") as fh:
+        digest.update(fh.read(SAMPLE_SIZE))
+        if stat.st_size > SAMPLE_SIZE:
+            fh.seek(max(SAMPLE_SIZE, stat.st_size - SAMPLE_SIZE))
+            digest.update(fh.read(SAMPLE_SIZE))
+    return digest.hexdigest()[:20]
+
+
+def _index_path(cache_dir, key):
+    return os.path.join(cache_dir, key + ".json")
+
+
+def _chat_path(cache_dir, key, chat_id):
+    return os.path.join(cache_dir, key + "_" + str(chat_id) + ".npz")
+
+
+def _load_index(cache_dir, key):
+    try:
+        with open(_index_path(cache_dir, key), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return None
+
+
+def _save_index(cache_dir, key, index):
+    tmp = _index_path(cache_dir, key) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(index, fh)
+    os.replace(tmp, _index_path(cache_dir, key))
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+"""
+@input  cache_dir (str)
+@input  key       (str)       fingerprint() of the export
+@input  select    (function)  called with the cached chat headers
+@output chat      (dict)      header of the chat, None if not cached
+@output table     (dict)
+"""
+
+
+def load_chat(cache_dir, key, select):
+    index = _load_index(cache_dir, key)
+    if index is None:
+        return None, None
+    for chat in index["chats"].values():
+        if select(chat):
+            table = load_table(cache_dir, key, chat["id"])
+            if table is not None:
+                return dict(chat), table
+    return None, None
+
+
+# all cached chats of an export, None unless the whole export has been cached
+def cached_chats(cache_dir, key):
+    index = _load_index(cache_dir, key)
+    if index is None or not index.get("complete"):
+        return None
+    return list(index["chats"].values())
+
+
+def load_table(cache_dir, key, chat_id):
+    path = _chat_path(cache_dir, key, chat_id)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            table = {}
+            for name, typecode, dtype in COLUMNS:
+                table[name] = data[name]
+            text = bytes(data["text"]).decode("utf-8", "surrogatepass")
+            offsets = data["text_offsets"].tolist()
+            names = json.loads(bytes(data["names"]).decode("utf-8"))
+    # a truncated or corrupt entry is a miss, the export is parsed again
+    except (IOError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+    table["text"] = [text[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+    table["senders"] = names["senders"]
+    table["media_types"] = names["media_types"]
+    _touch(path)
+    _touch(_index_path(cache_dir, key))
+    return table
+
+
+"""
+@input  cache_dir (str)
+@input  key       (str)   fingerprint() of the export
+@input  source    (str)   path of the export, older entries of it are dropped
+@input  chat      (dict)  chat header (name, id, type)
+@input  table     (dict)
+@input  max_bytes (int)   size cap of the whole cache directory
+"""
+
+
+def store_chat(cache_dir, key, source, chat, table, max_bytes):
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    source = os.path.abspath(source)
+    index = _load_index(cache_dir, key)
+    if index is None:
+        _drop_source(cache_dir, source)
+        index = {"source": source, "complete": False, "chats": {}}
+
+    lengths = np.fromiter(
+        (len(text) for text in table["text"]), dtype=np.int64, count=len(table["text"])
+    )
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    arrays = {}
+    for name, typecode, dtype in COLUMNS:
+        arrays[name] = table[name]
+    # lone surrogates of broken emojis are valid in json strings
+    text = "".join(table["text"]).encode("utf-8", "surrogatepass")
+    arrays["text"] = np.frombuffer(text, dtype=np.uint8)
+    arrays["text_offsets"] = offsets
+    names = {"senders": table["senders"], "media_types": table["media_types"]}
+    arrays["names"] = np.frombuffer(json.dumps(names).encode("utf-8"), dtype=np.uint8)
+    path = _chat_path(cache_dir, key, chat["id"])
+    # np.savez appends .npz to names without it
+    tmp = path[: -len(".npz")] + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+    header = {}
+    for field in ("name", "id", "type"):
+        header[field] = chat.get(field)
+    index["chats"][str(chat["id"])] = header
+    _save_index(cache_dir, key, index)
+    evict(cache_dir, max_bytes)
+
+
+# marks that every chat of the export is in the cache
+def mark_complete(cache_dir, key):
+    index = _load_index(cache_dir, key)
+    if index is not None:
+        index["complete"] = True
+        _save_index(cache_dir, key, index)
+
+
+# the files of every export in the cache, nothing else in cache_dir is touched:
+# only keys with a valid index, their tables and the leftovers of their writes
+def _entries(cache_dir):
+    filenames = os.listdir(cache_dir)
+    entries = {}
+    for filename in filenames:
+        match = _index_name.fullmatch(filename)
+        if match is None:
+            continue
+        index = _load_index(cache_dir, match.group(1))
+        if isinstance(index, dict) and "source" in index and isinstance(index.get("chats"), dict):
+            entries[match.group(1)] = [os.path.join(cache_dir, filename)]
+    for filename in filenames:
+        match = _entry_name.fullmatch(filename)
+        if match is not None and match.group(1) in entries:
+            entries[match.group(1)].append(os.path.join(cache_dir, filename))
+    return entries
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# removes the entries of older versions of the same export
+def _drop_source(cache_dir, source):
+    for key, paths in _entries(cache_dir).items():
+        index = _load_index(cache_dir, key)
+        if index is not None and index.get("source") == source:
+            _remove(paths)
+
+
+"""
+@input  cache_dir (str)
+@input  max_bytes (int)
+
+removes whole exports, least recently used first, until the cache fits
+"""
+
+
+def evict(cache_dir, max_bytes):
+    exports = []
+    total = 0
+    for key, paths in _entries(cache_dir).items():
+        size = 0
+        last_use = 0
+        for path in paths:
+            stat = os.stat(path)
+            size += stat.st_size
+            last_use = max(last_use, stat.st_mtime)
+        exports.append((last_use, size, paths))
+        total += size
+    exports.sort()
+    # the most recent export is kept even if it is larger than the cap
+    for last_use, size, paths in exports[:-1]:
+        if total <= max_bytes:
+            break
+        _remove(paths)
+        total -= size
@@ -0,0 +1,236 @@
+#! /usr/bin/python3
+
+import json
+import re
+
+
+"""
+Incremental reader for Telegram result.json exports.
+
+A full export can be several gigabytes, but only one chat is ever analyzed.
+The reader walks the JSON text chunk by chunk and decodes the messages of the
+selected chat one at a time. Values it is not interested in are skipped: the
+ones that fit into the buffer are run through the C decoder and dropped right
+away (much faster than scanning them in Python), larger ones are walked
+element by element, so memory stays flat for any size of export.
+"""
+
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonStream:
+    def __init__(self, fh):
+        self.fh = fh
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    # drops the consumed part of the buffer and appends the next chunk
+    # the chunk grows with the buffer so re-decoding a long value stays linear
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.fh.read(max(CHUNK_SIZE, len(self.buf) - self.pos))
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+            return False
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(
+                "wrong file format (expected '" + char + "' in the json data)"
+            )
+        self.pos += 1
+
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer could continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def skip_value(self):
+        char = self.peek()
+        if char not in ("[", "{"):
+            self.read_value()  # scalars are small
+            return
+        # a value that is complete in the buffer is skipped by the C decoder,
+        # only larger ones are walked element by element
+        try:
+            self.pos = _decoder.raw_decode(self.buf, self.pos)[1]
+            return
+        except json.JSONDecodeError:
+            pass
+        if char == "{":
+            for key in self.iter_object():
+                self.skip_value()
+        else:
+            for _ in self.iter_array():
+                self.skip_value()
+
+    # yields the keys of an object, the caller has to consume each value
+    def iter_object(self):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError("wrong file format (expected ',' or '}')")
+
+    # yields once per element of an array, the caller has to consume each value
+    def iter_array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("wrong file format (expected ',' or ']')")
+
+
+def _open(path):
+    return _JsonStream(open(path, encoding="utf-8-sig"))
+
+
+"""
+@input  path (str)
+@output kind (str)  "full" for a full export, "single" for a single chat export
+"""
+
+
+def export_kind(path):
+    stream = _open(path)
+    try:
+        for key in stream.iter_object():
+            if key == "chats":
+                return "full"
+            if key == "messages":
+                return "single"
+            stream.skip_value()
+        raise ValueError("wrong file format (no chats or messages found)")
+    finally:
+        stream.fh.close()
+
+
+def _iter_messages(stream, state):
+    fields = state["fields"]
+    for _ in stream.iter_array():
+        if state["skip"]:
+            stream.skip_value()
+        elif fields is None:
+            yield stream.read_value()
+        else:
+            # decoding the whole message in C is faster than skipping its keys
+            message = stream.read_value()
+            yield {key: message[key] for key in fields if key in message}
+
+
+"""
+@input  stream (_JsonStream)     positioned at the start of a chat object
+@input  select (function)        called with the chat header (name, id, type)
+@input  fields (list)            keys kept of every message, None for all
+@output chats  (generator)
+
+Yields the chat once. If select() accepts the header, chat["messages"] is a
+generator that decodes one message at a time. The generator has to be
+consumed before the stream is advanced, whatever is left is skipped.
+Telegram writes "name", "type" and "id" before "messages".
+"""
+
+
+def _iter_chat(stream, select, fields=None):
+    chat = {}
+    yielded = False
+    for key in stream.iter_object():
+        if key != "messages":
+            chat[key] = stream.read_value()
+        elif not yielded and select is not None and select(chat):
+            state = {"skip": False, "fields": fields}
+            messages = _iter_messages(stream, state)
+            chat["messages"] = messages
+            yield chat
+            yielded = True
+            # skip whatever the caller did not read
+            state["skip"] = True
+            for _ in messages:
+                pass
+        else:
+            stream.skip_value()
+    if not yielded:
+        yield chat
+
+
+"""
+@input  path   (str)        path to a full result.json export
+@input  select (function)   chooses the chats whose messages are decoded
+@input  fields (list)       keys kept of every message, None for all
+@output chats  (generator)
+
+Yields every chat of the export. Only the chats accepted by select() carry a
+"messages" generator, the messages of all the others are skipped.
+"""
+
+
+def iter_chats(path, select=None, fields=None):
+    stream = _open(path)
+    for key in stream.iter_object():
+        if key == "messages":
+            raise ValueError("wrong file format (single chat export)")
+        if key != "chats":
+            stream.skip_value()
+            continue
+        for chats_key in stream.iter_object():
+            if chats_key != "list":
+                stream.skip_value()
+                continue
+            for _ in stream.iter_array():
+                for chat in _iter_chat(stream, select, fields):
+                    yield chat
+    stream.fh.close()
+
+
+"""
+@input  path   (str)   path to a single chat export
+@input  fields (list)  keys kept of every message, None for all
+@output chat   (dict)  with chat["messages"] as a generator
+"""
+
+
+def load_single_chat(path, fields=None):
+    # the single chat export is one chat object at the top level
+    for chat in _iter_chat(_open(path), lambda chat: True, fields):
+        return chat
@@ -0,0 +1,65 @@
+#! /usr/bin/python3
+
+import json
+import sys
+
+
+"""
+Streaming writers for the converted chats of convert-*.py.
+
+The messages are encoded and written one at a time as they come from the
+reader, so converting a chat of any length needs the memory of one message.
+
+write_export() writes a full Telegram style export with a single chat, which
+telegram-statistics.py reads like any other export. The chat header is written
+before the messages, the way Telegram does it, so the chat can be selected by
+its name while the messages are streamed.
+
+write_ndjson() writes one message per line, for other tools.
+The path - writes to stdout.
+"""
+
+
+def _open(path):
+    if path == "-":
+        return open(sys.stdout.fileno(), "w", encoding="utf-8", closefd=False)
+    return open(path, "w", encoding="utf-8")
+
+
+"""
+@input  path     (str)
+@input  chat     (dict)      chat header (name, type, id)
+@input  messages (iterable)  messages of the chat
+@output count    (int)       number of messages written
+"""
+
+
+def write_export(path, chat, messages):
+    count = 0
+    with _open(path) as fh:
+        fh.write('{\n "chats": {\n  "about": "This page lists all chats from this export.",\n')
+        fh.write('  "list": [\n   ' + json.dumps(chat, ensure_ascii=False)[:-1])
+        fh.write(', "messages": [')
+        for message in messages:
+            if count > 0:
+                fh.write(",")
+            fh.write("\n    " + json.dumps(message, ensure_ascii=False))
+            count += 1
+        fh.write("\n   ]}\n  ]\n }\n}\n")
+    return count
+
+
+"""
+@input  path     (str)
+@input  messages (iterable)  messages of the chat
+@output count    (int)       number of messages written
+"""
+
+
+def write_ndjson(path, messages):
+    count = 0
+    with _open(path) as fh:
+        for message in messages:
+            fh.write(json.dumps(message, ensure_ascii=False) + "\n")
+            count += 1
+    return count
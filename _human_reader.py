@@ -0,0 +1,140 @@
+#! /usr/bin/python3
+
+from datetime import datetime
+from itertools import chain, islice
+import re
+
+
+"""
+Streaming reader for plain text chat logs of convert-human.py.
+
+    [2019-05-30T12:34:56] [Name Surname]: first line of the text
+    second line of the same message
+
+Every line starting with "[" starts a message, the other lines continue its
+text. Only the message being read is held in memory.
+
+The timestamps of a log all have the same layout, so it is detected once from
+the first k_sample_lines lines. Every timestamp is then checked against the
+compiled pattern of that layout and the normalized date is cut out of it at
+fixed positions, without parsing it into a datetime. Only timestamps that do
+not fit the layout go through strptime() with all known layouts, the ones
+that fail as well are skipped.
+"""
+
+k_sample_lines = 200
+
+_digits = r"\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])"
+_time = r"(?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d"
+
+# name: (strptime format, compiled pattern of the timestamp)
+LAYOUTS = {
+    "iso": ("%Y-%m-%dT%H:%M:%S", re.compile(_digits + "T" + _time)),
+    "space": ("%Y-%m-%d %H:%M:%S", re.compile(_digits + " " + _time)),
+    "fraction": ("%Y-%m-%d %H:%M:%S.%f", re.compile(_digits + " " + _time + r"\.\d{1,6}")),
+}
+
+CHAT = {"name": "unknown", "type": "personal_chat", "id": 1}
+
+_month_days = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _split(chunk):
+    parts = chunk.split("]", 2)
+    if len(parts) != 3:
+        return None
+    return parts[0].replace("[", "").strip(), parts[1].replace("[", "").strip(), parts[2][2:]
+
+
+"""
+@input  lines  (list)  first lines of the log
+@output layout (str)   key of LAYOUTS that fits most timestamps, None if none fits
+"""
+
+
+def detect_layout(lines):
+    counts = dict.fromkeys(LAYOUTS, 0)
+    for line in lines:
+        if not line.startswith("["):
+            continue
+        parts = _split(line)
+        if parts is None:
+            continue
+        for layout, (format, pattern) in LAYOUTS.items():
+            if pattern.fullmatch(parts[0]):
+                counts[layout] += 1
+    layout = max(counts, key=counts.get)
+    return layout if counts[layout] > 0 else None
+
+
+def _valid_day(date_time):
+    day = int(date_time[8:10])
+    if day <= 28:
+        return True
+    year = int(date_time[0:4])
+    month = int(date_time[5:7])
+    if month == 2 and day == 29:
+        return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    return day <= _month_days[month - 1]
+
+
+def _fallback(date_time):
+    # the layout of every single timestamp, as the converter always did it
+    for format, pattern in LAYOUTS.values():
+        try:
+            return datetime.strptime(date_time, format).strftime("%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            pass
+    return None
+
+
+"""
+@input  lines    (iterable)   lines of the log, e.g. the open file
+@input  counts   (dict)       gets the "layout" and the number of "fallback"
+                              and "skipped" messages, None to ignore them
+@output messages (generator)  Telegram style messages (id, type, date, from, text)
+"""
+
+
+def iter_messages(lines, counts=None):
+    if counts is None:
+        counts = {}
+    lines = iter(lines)
+    sample = list(islice(lines, k_sample_lines))
+    layout = detect_layout(sample)
+    counts["layout"] = layout
+    counts["fallback"] = 0
+    counts["skipped"] = 0
+    pattern = LAYOUTS[layout][1] if layout is not None else None
+
+    id = 0
+    chunk = None
+    for line in chain(sample, lines, ["["]):
+        if not line.startswith("["):
+            if chunk is not None:
+                chunk.append(line)
+            continue
+        parts = None
+        if chunk is not None:
+            parts = _split("".join(chunk).rstrip("\r\n"))
+        chunk = [line]
+        if parts is None:
+            continue
+        date_time, name, text = parts
+        if pattern is not None and pattern.fullmatch(date_time) and _valid_day(date_time):
+            date = date_time[0:10] + "T" + date_time[11:19]
+        else:
+            counts["fallback"] += 1
+            date = _fallback(date_time)
+            if date is None:
+                counts["skipped"] += 1
+                continue
+        message = {}
+        message["id"] = id
+        message["type"] = "message"
+        message["date"] = date
+        message["edited"] = "1970-01-01T01:00:00"
+        message["from"] = name
+        message["text"] = text
+        yield message
+        id += 1
@@ -0,0 +1,88 @@
+#! /usr/bin/python3
+
+from itertools import islice
+
+from _export_reader import load_single_chat
+import _human_reader
+import _whatsapp_reader
+
+
+"""
+Input adapters of telegram-statistics.py.
+
+Every adapter opens one chat of its format and returns it like the Telegram
+reader does: the chat header (name, type, id) with chat["messages"] as a
+generator of Telegram style messages. The messages go straight into
+_message_table.build_table(), a WhatsApp or plain text log is analyzed
+without converting it to an intermediate json file first.
+
+    telegram   result.json of the Telegram desktop client
+    whatsapp   "WhatsApp Chat with Name.txt" (see _whatsapp_reader)
+    human      plain text log "[timestamp] [Name]: text" (see _human_reader)
+
+Full Telegram exports with several chats are read by _export_reader directly.
+"""
+
+FORMATS = ("telegram", "whatsapp", "human")
+
+k_sample_size = 1 << 16
+
+
+def _lines(path, reader, fields):
+    with open(path, "r", encoding="utf-8-sig") as fh:
+        for message in reader(fh):
+            if fields is None:
+                yield message
+            else:
+                yield {key: message[key] for key in fields if key in message}
+
+
+def _telegram(path, fields):
+    return load_single_chat(path, fields)
+
+
+def _whatsapp(path, fields):
+    chat = dict(_whatsapp_reader.CHAT)
+    chat["messages"] = _lines(path, _whatsapp_reader.iter_messages, fields)
+    return chat
+
+
+def _human(path, fields):
+    chat = dict(_human_reader.CHAT)
+    chat["messages"] = _lines(path, _human_reader.iter_messages, fields)
+    return chat
+
+
+ADAPTERS = {"telegram": _telegram, "whatsapp": _whatsapp, "human": _human}
+
+
+"""
+@input  path   (str)
+@output format (str)  one of FORMATS, None if the file fits none of them
+"""
+
+
+def detect_format(path):
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as fh:
+        sample = fh.read(k_sample_size)
+    if sample.lstrip().startswith("{"):
+        return "telegram"
+    lines = list(islice(sample.splitlines(), _human_reader.k_sample_lines))
+    for line in lines:
+        if _whatsapp_reader.is_header(line):
+            return "whatsapp"
+    if _human_reader.detect_layout(lines) is not None:
+        return "human"
+    return None
+
+
+"""
+@input  path   (str)
+@input  format (str)   one of FORMATS
+@input  fields (list)  keys kept of every message, None for all
+@output chat   (dict)  with chat["messages"] as a generator
+"""
+
+
+def load_chat(path, format, fields=None):
+    return ADAPTERS[format](path, fields)
@@ -0,0 +1,535 @@
+#! /usr/bin/python3
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from _message_dates import decode_day, month_of_index, day_of_index
+from _message_table import MESSAGE, SERVICE, OTHER
+from _message_text import count_words, count_emojis
+from _aho_corasick import build_automaton, count_matches
+from _quantile_sketch import sketch, merge_sketches, percentiles
+
+
+"""
+Aggregation of a chat table (see _message_table) into the per person metrics
+used by both the text reports (_message_numerics) and the plots
+(_message_graphs).
+
+The date filter and the time buckets (month, day, weekday, hour) are
+computed once for all rows, then every registered accumulator derives its
+metrics from these columns. Time series are vectorized bincounts, only the
+text based metrics look at the messages one by one.
+A new metric only needs a new accumulator, not another loop over the chat.
+"""
+
+k_same_initiation_hours_treshold = 5 * 60 * 60
+# below this many substrings str.count() is faster than the automaton
+k_aho_corasick_min_words = 32
+# smaller shards cost more to send to a worker than to aggregate
+k_min_shard_rows = 50000
+# upper bound of the date range without --date-until (year 10000)
+k_no_date_limit = 253402300800
+# local time is at most 14 hours off the unixtime (UTC+14, UTC-12)
+k_max_utc_offset = 14 * 60 * 60
+# the unixtime of older exports is the local time, it goes back at daylight saving time
+k_max_clock_step = 2 * 60 * 60
+# rows around each bound that are checked for dates going backwards
+k_bound_check_rows = 256
+
+ACCUMULATORS = []
+
+
+# registers fn(metrics, view) to be called once per chat
+def accumulator(fn):
+    ACCUMULATORS.append(fn)
+    return fn
+
+
+# message has to be lowercased already, counts holds the hits per substring
+def count_occurrences(message, wordlist, counts):
+    hits = 0
+    for index, substring in enumerate(wordlist):
+        if len(substring) > 0:
+            count = message.count(substring)
+            counts[index] += count
+            hits += count
+    return hits
+
+
+"""
+@input  keys    (array)  bucket index of every row
+@input  mask    (array)  rows to count
+@input  weights (array)  summed instead of counting rows (optional)
+@output buckets (dict)   bucket index -> count or sum, only for buckets with rows
+"""
+
+
+def _bucket(keys, mask, weights=None):
+    selected = keys[mask]
+    if len(selected) == 0:
+        return {}
+    base = int(selected.min())
+    selected = selected - base
+    present = np.bincount(selected)
+    if weights is None:
+        totals = present
+    else:
+        totals = np.bincount(selected, weights=weights[mask])
+        if weights.dtype.kind in "iub":
+            totals = totals.astype(np.int64)
+    totals = totals.tolist()
+    buckets = {}
+    for key in np.flatnonzero(present).tolist():
+        buckets[base + key] = totals[key]
+    return buckets
+
+
+def _by_month(buckets):
+    months = {}
+    for key, value in buckets.items():
+        months[month_of_index(key)] = value
+    return months
+
+
+def _by_day(buckets):
+    days = {}
+    for key, value in buckets.items():
+        days[day_of_index(key)] = value
+    return days
+
+
+@accumulator
+def count_messages(metrics, view):
+    table = view["table"]
+    for person in ("A", "B"):
+        rows = view["messages_" + person]
+        metrics[person]["total_messages"] = int(np.count_nonzero(rows))
+        metrics[person]["total_chars"] = int(table["chars"][rows].sum())
+        if person == "B" and metrics[person]["total_messages"] > 0:
+            # the last name person B has written with
+            last = np.flatnonzero(rows)[-1]
+            metrics[person]["name"] = table["senders"][table["sender"][last]]
+
+
+@accumulator
+def count_media(metrics, view):
+    table = view["table"]
+    for person in ("A", "B"):
+        rows = view["messages_" + person]
+        media = {}
+        for code, count in _bucket(table["media"], rows & (table["media"] >= 0)).items():
+            media[table["media_types"][code]] = count
+        metrics[person]["media"] = media
+        photos = rows & table["photo"]
+        if photos.any():
+            metrics[person]["photo"] = int(np.count_nonzero(photos))
+        metrics[person]["monthly_pictures"] = _by_month(_bucket(view["month"], photos))
+        urls = int(table["links"][rows].sum())
+        if urls > 0:
+            metrics[person]["urls"] = urls
+        markdown = int(table["markdown"][rows].sum())
+        if markdown > 0:
+            metrics[person]["markdown"] = markdown
+
+
+# every message is tokenized on its own, no text of several messages is joined
+@accumulator
+def count_text(metrics, view):
+    texts = view["table"]["text"]
+    for person in ("A", "B"):
+        word_counts = Counter()
+        emoji_counts = Counter()
+        total_words = 0
+        for row in np.flatnonzero(view["messages_" + person]).tolist():
+            text = texts[row]
+            total_words += count_words(text, word_counts)
+            count_emojis(text, emoji_counts)
+        metrics[person]["word_counts"] = word_counts
+        metrics[person]["emoji_counts"] = emoji_counts
+        metrics[person]["total_words"] = total_words
+
+
+@accumulator
+def count_time_buckets(metrics, view):
+    for person in ("A", "B"):
+        rows = view["messages_" + person]
+        metrics[person]["months"] = _by_month(_bucket(view["month"], rows))
+        metrics[person]["days"] = _by_day(_bucket(view["day"], rows))
+        metrics[person]["weekdays"] = _bucket(view["weekday"], rows)
+        metrics[person]["hourofday"] = _bucket(view["hour"], rows)
+
+
+@accumulator
+def count_characters(metrics, view):
+    chars = view["table"]["chars"]
+    for person in ("A", "B"):
+        rows = view["messages_" + person]
+        metrics[person]["months_chars"] = _by_month(_bucket(view["month"], rows, chars))
+        metrics[person]["days_chars"] = _by_day(_bucket(view["day"], rows, chars))
+
+
+@accumulator
+def count_word_occurrences(metrics, view):
+    texts = view["table"]["text"]
+    wordlist = view["wordlist"]
+    automaton = None
+    if len(wordlist) >= k_aho_corasick_min_words:
+        automaton = build_automaton(wordlist)
+    occurrences = np.zeros(len(texts), dtype=np.int64)
+    for person in ("A", "B"):
+        rows = view["messages_" + person]
+        counts = [0] * len(wordlist)
+        if wordlist:
+            for row in np.flatnonzero(rows).tolist():
+                text = texts[row].lower()
+                if automaton is not None:
+                    occurrences[row] = count_matches(automaton, text, counts)
+                else:
+                    occurrences[row] = count_occurrences(text, wordlist, counts)
+        word_occurrences = {}
+        for substring, count in zip(wordlist, counts):
+            if len(substring) > 0:
+                word_occurrences[substring] = word_occurrences.get(substring, 0) + count
+        metrics[person]["word_occurrences"] = word_occurrences
+        metrics[person]["monthly_word_occurrence"] = _by_month(
+            _bucket(view["month"], rows, occurrences)
+        )
+
+
+"""
+A message answers the previous message (of any type) if that one was sent by
+somebody else less than k_same_initiation_hours_treshold ago. If it was sent
+earlier, or has no sender (service messages), the message starts a new
+conversation. Consecutive messages of the same sender are neither.
+"""
+
+
+@accumulator
+def count_replies(metrics, view):
+    table = view["table"]
+    rows = np.flatnonzero(view["rows"])
+    sender = table["sender"][rows]
+    unixtime = table["unixtime"][rows]
+    # the first row answers the last row before the slice, if there is one
+    previous_sender = np.concatenate(([view["previous_sender"]], sender[:-1]))
+    if view["previous_unixtime"] is not None:
+        replytime = np.diff(unixtime, prepend=view["previous_unixtime"])
+    else:
+        replytime = np.diff(unixtime, prepend=unixtime[:1])
+    is_message = table["type"][rows] == MESSAGE
+    changed = sender != previous_sender
+    has_previous = previous_sender >= 0
+    replied = is_message & has_previous & changed & (
+        replytime < k_same_initiation_hours_treshold
+    )
+    initiated = is_message & ~(has_previous & ~changed) & ~replied
+
+    month = view["month"][rows]
+    person_a = view["person_a"][rows]
+    for person in ("A", "B"):
+        mine = person_a if person == "A" else ~person_a
+        metrics[person]["monthly_n_replied"] = _by_month(_bucket(month, replied & mine))
+        metrics[person]["monthly_time_to_reply"] = _by_month(
+            _bucket(month, replied & mine, replytime)
+        )
+        metrics[person]["monthly_new_initiation"] = _by_month(
+            _bucket(month, initiated & mine)
+        )
+
+        # one quantile sketch of the reply times per month, grouped by sorting
+        gaps = replytime[replied & mine]
+        gap_months = month[replied & mine]
+        order = np.argsort(gap_months, kind="stable")
+        keys, starts = np.unique(gap_months[order], return_index=True)
+        monthly_sketch = {}
+        for key, values in zip(keys.tolist(), np.split(gaps[order], starts[1:])):
+            monthly_sketch[month_of_index(key)] = sketch(values)
+        metrics[person]["reply_time_sketch"] = sketch(gaps)
+        metrics[person]["monthly_reply_time_sketch"] = monthly_sketch
+        _reply_statistics(metrics[person])
+
+
+# the statistics derived from the summed reply times and the sketches
+def _reply_statistics(person):
+    avg_reply_time = {}
+    for month_obj, count in person["monthly_n_replied"].items():
+        avg_reply_time[month_obj] = person["monthly_time_to_reply"][month_obj] / count
+    person["monthly_avg_reply_time"] = avg_reply_time
+    monthly_percentiles = {}
+    monthly_median = {}
+    for month_obj, month_sketch in person["monthly_reply_time_sketch"].items():
+        monthly_percentiles[month_obj] = percentiles(month_sketch)
+        monthly_median[month_obj] = monthly_percentiles[month_obj]["median"]
+    person["monthly_reply_time_percentiles"] = monthly_percentiles
+    person["monthly_median_reply_time"] = monthly_median
+    person["reply_time_percentiles"] = percentiles(person["reply_time_sketch"])
+
+
+@accumulator
+def count_calls(metrics, view):
+    table = view["table"]
+    # only count if the call was answered
+    calls = view["rows"] & (table["type"] == SERVICE) & (table["duration"] >= 0)
+    # calls are shared by both persons
+    for person in ("A", "B"):
+        metrics[person]["monthly_call_duration"] = _by_month(
+            _bucket(view["month"], calls, table["duration"])
+        )
+        metrics[person]["monthly_calls"] = _by_month(_bucket(view["month"], calls))
+        metrics[person]["call_hourofday"] = _bucket(view["hour"], calls)
+
+
+# person A is the sender of the 2nd message
+# (the 1st message can be "joined telegram" which has no "from" key),
+# the first one who sent a message if the 2nd has no sender either
+def _find_person_a(table):
+    if len(table["sender"]) > 1 and table["sender"][1] >= 0:
+        return table["senders"][table["sender"][1]]
+    senders = np.flatnonzero(table["sender"] >= 0)
+    if len(senders) == 0:
+        return None
+    return table["senders"][table["sender"][senders[0]]]
+
+
+def _slice(table, first, stop):
+    if first == 0 and stop == len(table["type"]):
+        return table
+    rows = {}
+    for name in table:
+        if name in ("senders", "media_types"):
+            rows[name] = table[name]
+        else:
+            rows[name] = table[name][first:stop]
+    return rows
+
+
+# sender and time of the last counted row before row first, replies to it are
+# counted in the range starting at first. No row before floor is counted, the
+# rows in between are searched backwards in growing blocks.
+def _context(table, oldest_date, newest_date, floor, first):
+    size = 64
+    while first > floor:
+        begin = max(floor, first - size)
+        seconds = table["seconds"][begin:first]
+        earlier = np.flatnonzero(
+            (table["type"][begin:first] != OTHER)
+            & (seconds >= oldest_date)
+            & (seconds < newest_date)
+        )
+        if len(earlier) > 0:
+            row = begin + earlier[-1]
+            return (int(table["sender"][row]), int(table["unixtime"][row]))
+        first = begin
+        size *= 2
+    return (-1, None)
+
+
+# aggregates a whole (sliced) table, runs in the worker processes of aggregate()
+def _aggregate_rows(table, oldest_date, newest_date, wordlist, name_a, context):
+    metrics = {}
+    metrics["A"] = {}
+    metrics["B"] = {}
+    metrics["A"]["name"] = name_a
+    metrics["total"] = len(table["type"])
+
+    # person A wrote (or acted in) a row if its name is part of the author
+    is_a = np.array(
+        [name_a is not None and name_a in (name or "") for name in table["senders"]]
+        + [False],
+        dtype=np.bool_,
+    )
+    seconds = table["seconds"]
+    view = {}
+    view["table"] = table
+    view["wordlist"] = wordlist
+    view["previous_sender"], view["previous_unixtime"] = context
+    view["rows"] = (
+        (table["type"] != OTHER) & (seconds >= oldest_date) & (seconds < newest_date)
+    )
+    view["messages"] = view["rows"] & (table["type"] == MESSAGE)
+    # author -1 maps to the trailing False
+    view["person_a"] = is_a[table["author"]]
+    view["messages_A"] = view["messages"] & view["person_a"]
+    view["messages_B"] = view["messages"] & ~view["person_a"]
+    view["day"] = seconds // 86400
+    view["month"] = seconds.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    view["weekday"] = (view["day"] + 3) % 7  # 1970-01-01 was a thursday
+    view["hour"] = (seconds - view["day"] * 86400) // 3600
+
+    for accumulate in ACCUMULATORS:
+        accumulate(metrics, view)
+    return metrics
+
+
+"""
+@input  table   (dict)   chat table of _message_table.build_table
+@input  oldest  (int)    first second of the date range (local time)
+@input  newest  (int)    first second after the date range (local time)
+@input  first   (int)
+@input  stop    (int)
+@output first   (int)    the rows from first to stop contain every row of the
+@output stop    (int)    date range, the first and the last one are inside it
+
+Exports are ordered by message id, which is the order of the unixtime as well,
+so the bounds are found by bisection over the unixtime, widened by the largest
+UTC offset (and the step of a daylight saving clock change for older exports
+without a unixtime). Only the rows of that window are compared with the date
+range in local time. If the rows around a bound go backwards by more than a
+clock change (imported messages), the whole column is scanned instead; rows
+out of order far from both bounds are not looked for.
+"""
+
+
+def _ordered_around(unixtime, bound):
+    window = unixtime[max(bound - k_bound_check_rows, 0) : bound + k_bound_check_rows]
+    return bool(np.all(window[1:] - window[:-1] >= -k_max_clock_step))
+
+
+def _date_range(table, oldest, newest, first, stop):
+    unixtime = table["unixtime"][first:stop]
+    seconds = table["seconds"][first:stop]
+    margin = k_max_utc_offset + k_max_clock_step
+    begin = int(np.searchsorted(unixtime, oldest - margin, side="left"))
+    end = int(np.searchsorted(unixtime, newest + margin, side="left"))
+    if not (_ordered_around(unixtime, begin) and _ordered_around(unixtime, end)):
+        begin, end = 0, len(unixtime)
+    part = seconds[begin:end]
+    inside = np.flatnonzero((part >= oldest) & (part < newest))
+    if len(inside) == 0:
+        return first, first
+    return first + begin + int(inside[0]), first + begin + int(inside[-1]) + 1
+
+
+"""
+@input  table       (dict)  chat table of _message_table.build_table
+@input  date_filter (str)   only count messages after date [YYYY-MM-DD]
+@input  wordlist    (list)  substrings counted in the text of the messages
+@input  first       (int)   only aggregate the rows from first ...
+@input  stop        (int)   ... up to stop (exclusive), None for all
+@input  jobs        (int)   number of worker processes
+@input  date_until  (str)   only count messages up to date [YYYY-MM-DD] (inclusive)
+@output metrics     (dict)
+
+The metrics of consecutive row ranges can be combined with merge(). With
+several jobs, large ranges are split into contiguous shards that are
+aggregated in parallel and merged in order, each shard gets the last row
+before it as reply context.
+"""
+
+
+def aggregate(
+    table, date_filter, wordlist, first=0, stop=None, jobs=1, date_until=None
+):
+    # person A is the same for every range of the chat
+    name_a = _find_person_a(table)
+    oldest_date = decode_day(date_filter)["seconds"]
+    newest_date = k_no_date_limit
+    if date_until is not None:
+        newest_date = decode_day(date_until)["seconds"] + 86400
+    if stop is None:
+        stop = len(table["type"])
+    # the combined message count is the one of the whole range
+    total = stop - first
+    floor, ceiling = _date_range(table, oldest_date, newest_date, 0, len(table["type"]))
+    first = min(max(first, floor), stop)
+    stop = max(min(stop, ceiling), first)
+
+    shards = min(jobs, (stop - first) // k_min_shard_rows)
+    if shards < 2:
+        metrics = _aggregate_rows(
+            _slice(table, first, stop),
+            oldest_date,
+            newest_date,
+            wordlist,
+            name_a,
+            _context(table, oldest_date, newest_date, floor, first),
+        )
+        metrics["total"] = total
+        return metrics
+
+    bounds = np.linspace(first, stop, shards + 1).astype(np.int64).tolist()
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        futures = []
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            futures.append(
+                pool.submit(
+                    _aggregate_rows,
+                    _slice(table, begin, end),
+                    oldest_date,
+                    newest_date,
+                    wordlist,
+                    name_a,
+                    _context(table, oldest_date, newest_date, floor, begin),
+                )
+            )
+        metrics = futures[0].result()
+        for future in futures[1:]:
+            metrics = merge(metrics, future.result())
+    metrics["total"] = total
+    return metrics
+
+
+# buckets that keep the order they were first seen in instead of a sorted order
+_first_seen_order = ("media", "word_occurrences")
+# derived again by _reply_statistics() after merging
+_reply_statistics_keys = (
+    "monthly_avg_reply_time",
+    "monthly_reply_time_percentiles",
+    "monthly_median_reply_time",
+    "reply_time_percentiles",
+)
+
+
+def _add(older, newer, ordered):
+    added = dict(older)
+    for key, value in newer.items():
+        added[key] = added.get(key, 0) + value
+    if ordered and len(added) > len(older):
+        added = dict(sorted(added.items()))
+    return added
+
+
+"""
+@input  metrics (dict)  aggregate() of a range of rows
+@input  newer   (dict)  aggregate() of the rows right after that range
+@output merged  (dict)  the metrics of both ranges, as if aggregated at once
+
+Counts, buckets and sketches are added up, the name of person B is the more
+recent one and the reply time statistics are derived again from the merged
+sums and sketches.
+"""
+
+
+def merge(metrics, newer):
+    merged = {}
+    merged["total"] = metrics["total"] + newer["total"]
+    for person in ("A", "B"):
+        older = metrics[person]
+        recent = newer[person]
+        result = {}
+        for key in list(older) + [key for key in recent if key not in older]:
+            if key in _reply_statistics_keys:
+                continue
+            if key not in recent:
+                result[key] = older[key]
+            elif key not in older or key == "name":
+                result[key] = recent[key]
+            elif key == "reply_time_sketch":
+                result[key] = merge_sketches(older[key], recent[key])
+            elif key == "monthly_reply_time_sketch":
+                monthly_sketch = dict(older[key])
+                for month_obj, month_sketch in recent[key].items():
+                    if month_obj in monthly_sketch:
+                        month_sketch = merge_sketches(monthly_sketch[month_obj], month_sketch)
+                    monthly_sketch[month_obj] = month_sketch
+                result[key] = dict(sorted(monthly_sketch.items()))
+            elif isinstance(older[key], Counter):
+                result[key] = older[key] + recent[key]
+            elif isinstance(older[key], dict):
+                result[key] = _add(older[key], recent[key], key not in _first_seen_order)
+            else:
+                result[key] = older[key] + recent[key]
+        _reply_statistics(result)
+        merged[person] = result
+    return merged
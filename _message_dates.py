@@ -0,0 +1,99 @@
+#! /usr/bin/python3
+
+from datetime import date, datetime
+
+
+"""
+Timestamp decoding for the message loop.
+
+Telegram writes every date as "YYYY-MM-DDTHH:MM:SS" in local time, so the
+fields are sliced at fixed positions instead of going through strptime.
+The day and month bucket objects are created once per distinct day and
+reused by every message of that day.
+"""
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+_days = {}
+_months = {}
+
+
+def _month(year, month):
+    key = (year, month)
+    month_obj = _months.get(key)
+    if month_obj is None:
+        month_obj = datetime(year, month, 1)
+        _months[key] = month_obj
+    return month_obj
+
+
+def _new_day(day_obj):
+    day = {}
+    day["date"] = day_obj
+    day["month"] = _month(day_obj.year, day_obj.month)
+    day["weekday"] = day_obj.weekday()
+    day["seconds"] = (day_obj.toordinal() - EPOCH_ORDINAL) * 86400
+    return day
+
+
+"""
+@input  day_str (str)   "YYYY-MM-DD"
+@output day     (dict)  memoized bucket: date, month, weekday, seconds (epoch of 00:00)
+"""
+
+
+def decode_day(day_str):
+    day = _days.get(day_str)
+    if day is None:
+        day = _new_day(date.fromisoformat(day_str))
+        _days[day_str] = day
+    return day
+
+
+"""
+@input  date_str (str)   "YYYY-MM-DDTHH:MM:SS"
+@output day      (dict)  memoized bucket of decode_day()
+@output seconds  (int)   local wall clock time in seconds since 1970-01-01
+"""
+
+
+def decode_date(date_str):
+    if len(date_str) == 19 and date_str[10] == "T":
+        day = _days.get(date_str[:10])
+        if day is None:
+            day = decode_day(date_str[:10])
+        seconds = (
+            int(date_str[11:13]) * 3600
+            + int(date_str[14:16]) * 60
+            + int(date_str[17:19])
+        )
+        return day, day["seconds"] + seconds
+    # anything not in the fixed layout (fractions, offsets, ...)
+    date_obj = datetime.fromisoformat(date_str)
+    day = decode_day(date_obj.date().isoformat())
+    return day, day["seconds"] + date_obj.hour * 3600 + date_obj.minute * 60 + date_obj.second
+
+
+"""
+@input  message (dict)
+@input  seconds (int)   decoded local time of the message
+@output unixtime (int)
+
+exports since 2021 carry "date_unixtime", which is exact across daylight saving
+changes, older ones only have the local time
+"""
+
+
+def decode_unixtime(message, seconds):
+    if "date_unixtime" in message:
+        return int(message["date_unixtime"])
+    return seconds
+
+
+# the inverse of the bucket indexes used by the vectorized aggregation
+def month_of_index(index):
+    return _month(1970 + index // 12, index % 12 + 1)
+
+
+def day_of_index(index):
+    return date.fromordinal(EPOCH_ORDINAL + index)
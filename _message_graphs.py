@@ -1,189 +1,52 @@
 #! /usr/bin/python3
 
 from collections import Counter
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
 import numpy as np
 import pandas as pd
 import bokeh
 import bokeh.plotting as bkh
 from bokeh.core.properties import value
 from bokeh.transform import dodge
-from bokeh.models import ColumnDataSource
+from bokeh.models import ColumnDataSource, Panel, Tabs
+from bokeh.resources import CDN, INLINE
 import codecs
 import csv
 
+from _message_numerics import k_no_name
+
 # https://flatuicolors.com/palette/es
 colors = ["#34ace0", "#ffb142"]
 colors = ["#686de0", "#ffbe76"]
 
-k_same_initiation_hours_treshold = 5 * 60 * 60
-
-def count_occurrences(message, wordlist):
-    count = 0
-    for substring in wordlist:
-        count += message.lower().count(substring)
-    return count
-
-
-def _parse_chat(chat, date_filter, wordlist):
-    metrics = {}
-    metrics["A"] = {}
-    metrics["B"] = {}
-    metrics["A"]["days"] = {}
-    metrics["B"]["days"] = {}
-    metrics["A"]["months"] = {}
-    metrics["B"]["months"] = {}
-    metrics["A"]["months_chars"] = {}
-    metrics["B"]["months_chars"] = {}
-    metrics["A"]["days_chars"] = {}
-    metrics["B"]["days_chars"] = {}
-    metrics["A"]["weekdays"] = {}
-    metrics["B"]["weekdays"] = {}
-    metrics["A"]["hourofday"] = {}
-    metrics["B"]["hourofday"] = {}
-    metrics["A"]["monthly_n_replied"] = {}
-    metrics["B"]["monthly_n_replied"] = {}
-    metrics["A"]["monthly_time_to_reply"] = {}
-    metrics["B"]["monthly_time_to_reply"] = {}
-    metrics["A"]["monthly_avg_reply_time"] = {}
-    metrics["B"]["monthly_avg_reply_time"] = {}
-    metrics["A"]["monthly_new_initiation"] = {}
-    metrics["B"]["monthly_new_initiation"] = {}
-    metrics["A"]["monthly_pictures"] = {}
-    metrics["B"]["monthly_pictures"] = {}
-    metrics["A"]["monthly_calls"] = {}
-    metrics["B"]["monthly_calls"] = {}
-    metrics["A"]["monthly_word_occurrence"] = {}
-    metrics["B"]["monthly_word_occurrence"] = {}
-    metrics["A"]["monthly_call_duration"] = {}
-    metrics["B"]["monthly_call_duration"] = {}
-    # person A is the 2nd message (1st can be "joined telegram" which has no "from" key)
-    metrics["A"]["name"] = chat["messages"][1]["from"]
-    metrics["A"]["call_hourofday"] = {}
-    metrics["B"]["call_hourofday"] = {}
-    previous_message = {}
-    oldest_date = datetime.strptime(date_filter, "%Y-%m-%d")
-
-    for message in chat["messages"]:
-        if message["type"] == "unsupported":
-            continue
-        person = "B"
-        if "from" in message:
-            if metrics["A"]["name"] in message["from"]:
-                person = "A"
-        elif "actor" in message:
-            if metrics["A"]["name"] in message["actor"]:
-                person = "A"
-        date_obj = datetime.strptime(message["date"], "%Y-%m-%dT%H:%M:%S")
-        # check if message needs to be reviewed based on date
-        if date_obj >= oldest_date:
-            month_str = str(date_obj.year) + "-" + str(date_obj.month) + "-1"
-            month_obj = datetime.strptime(month_str, "%Y-%m-%d")
-            day_obj = date_obj.date()
-            # text and media
-            if message["type"] == "message":
-                metrics[person]["name"] = message["from"]
-                metrics[person]["months"][month_obj] = (
-                    metrics[person]["months"].get(month_obj, 0) + 1
-                )
-                metrics[person]["days"][day_obj] = (
-                    metrics[person]["days"].get(day_obj, 0) + 1
-                )
-                metrics[person]["weekdays"][date_obj.weekday()] = (
-                    metrics[person]["weekdays"].get(date_obj.weekday(), 0) + 1
-                )
-                metrics[person]["hourofday"][date_obj.hour] = (
-                    metrics[person]["hourofday"].get(date_obj.hour, 0) + 1
-                )
-                if type(message["text"]) is list:  # multiple elements in one message
-                    for line in message["text"]:
-                        if type(line) is str:
-                            # count characters
-                            metrics[person]["months_chars"][month_obj] = metrics[
-                                person
-                            ]["months_chars"].get(month_obj, 0) + len(line)
-                            metrics[person]["days_chars"][day_obj] = metrics[
-                                person
-                            ]["days_chars"].get(day_obj, 0) + len(line)
-                            # check if words occurr in message
-                            metrics[person]["monthly_word_occurrence"][
-                                month_obj
-                            ] = metrics[person]["monthly_word_occurrence"].get(
-                                month_obj, 0
-                            ) + count_occurrences(
-                                line, wordlist
-                            )
-                elif type(message["text"]) is str:
-                    # count characters
-                    metrics[person]["months_chars"][month_obj] = metrics[person][
-                        "months_chars"
-                    ].get(month_obj, 0) + len(message["text"])
-                    metrics[person]["days_chars"][day_obj] = metrics[person][
-                        "days_chars"
-                    ].get(day_obj, 0) + len(message["text"])
-                    # check if words occurr in message
-                    metrics[person]["monthly_word_occurrence"][month_obj] = metrics[
-                        person
-                    ]["monthly_word_occurrence"].get(month_obj, 0) + count_occurrences(
-                        message["text"], wordlist
-                    )
-                if "from" in previous_message:
-                    if not (previous_message["from"] == message["from"]):
-                        replytime = (
-                            datetime.strptime(message["date"], "%Y-%m-%dT%H:%M:%S")
-                            - datetime.strptime(
-                                previous_message["date"], "%Y-%m-%dT%H:%M:%S"
-                            )
-                        ).total_seconds()
-                        # Check if previous message is within timeframe to be considered a new conversation
-                        if replytime < k_same_initiation_hours_treshold:
-                            metrics[person]["monthly_n_replied"][month_obj] = (
-                                metrics[person]["monthly_n_replied"].get(month_obj, 0) + 1
-                            )
-                            metrics[person]["monthly_time_to_reply"][month_obj] = (
-                                metrics[person]["monthly_time_to_reply"].get(month_obj, 0)
-                                + replytime
-                            )
-                            avg_time = metrics[person]["monthly_time_to_reply"].get(
-                                month_obj, 0
-                            ) / metrics[person]["monthly_n_replied"].get(month_obj, 0)
-                            metrics[person]["monthly_avg_reply_time"][month_obj] = avg_time
-                        else:
-                            # Then it's a new initiation
-                            metrics[person]["monthly_new_initiation"][month_obj] = (
-                                metrics[person]["monthly_new_initiation"].get(month_obj, 0) + 1
-                            )
-                else:
-                    # First of all initiation
-                    metrics[person]["monthly_new_initiation"][month_obj] = (
-                        metrics[person]["monthly_new_initiation"].get(month_obj, 0) + 1
-                    )
-
-                if "photo" in message:
-                    metrics[person]["monthly_pictures"][month_obj] = (
-                        metrics[person]["monthly_pictures"].get(month_obj, 0) + 1
-                    )
-            # calls
-            elif message["type"] == "service":
-                if message["action"] == "phone_call":
-                    if (
-                        "duration_seconds" in message
-                    ):  # only count if the call was answered
-                        metrics["A"]["monthly_call_duration"][month_obj] = metrics["A"][
-                            "monthly_call_duration"
-                        ].get(month_obj, 0) + int(message["duration_seconds"])
-                        metrics["A"]["monthly_calls"][month_obj] = (
-                            metrics["A"]["monthly_calls"].get(month_obj, 0) + 1
-                        )
-                        metrics["A"]["call_hourofday"][date_obj.hour] = (
-                            metrics["A"]["call_hourofday"].get(date_obj.hour, 0) + 1
-                        )
-            previous_message = message
-
-    metrics["B"]["monthly_call_duration"] = metrics["A"]["monthly_call_duration"]
-    metrics["B"]["monthly_calls"] = metrics["A"]["monthly_calls"]
-    metrics["B"]["call_hourofday"] = metrics["A"]["call_hourofday"]
+# set by _message_graphs(), batch runs write the plots without opening a browser
+open_browser = True
+# where the html files load BokehJS from, "cdn" or "inline" (embedded in every file)
+resources_mode = "cdn"
+
+
+# saves a figure or a whole dashboard, opens it in the browser if requested
+def _output(obj, path, title):
+    if open_browser:
+        bkh.reset_output()
+        bkh.output_file(path, title=title, mode=resources_mode)
+        bkh.show(obj)
+    else:
+        # save() does not need the global output state and never opens a browser
+        mode = CDN if resources_mode == "cdn" else INLINE
+        bkh.save(obj, filename=path, resources=mode, title=title)
 
+"""
+@input  metrics (dict)  output of _message_aggregate.aggregate
+@output metrics (dict)  the same dict with the series and frames for the plots
+"""
+
+
+def _build_frames(metrics):
+    for person in ("A", "B"):
+        if metrics[person].get("name") is None:
+            metrics[person]["name"] = k_no_name
     metrics["A"]["day_series"] = pd.Series(metrics["A"]["days"])
     metrics["B"]["day_series"] = pd.Series(metrics["B"]["days"])
     metrics["A"]["series_days"] = pd.Series(metrics["A"]["days"])
@@ -210,6 +73,12 @@ def _parse_chat(chat, date_filter, wordlist):
     metrics["B"]["frame_months_reply_time"] = hacky_solution_to_fix_timedelta_dodge(
         metrics["B"]["monthly_avg_reply_time"], 5
     )
+    metrics["A"]["frame_months_median_reply_time"] = hacky_solution_to_fix_timedelta_dodge(
+        metrics["A"]["monthly_median_reply_time"], -5
+    )
+    metrics["B"]["frame_months_median_reply_time"] = hacky_solution_to_fix_timedelta_dodge(
+        metrics["B"]["monthly_median_reply_time"], 5
+    )
     metrics["A"]["frame_months_new_initiation"] = hacky_solution_to_fix_timedelta_dodge(
         metrics["A"]["monthly_new_initiation"], -5
     )
@@ -298,116 +167,276 @@ def hacky_solution_to_fix_timedelta_dodge(chunks, delta):
     return series.to_frame(name="frequency")
 
 
-# called by the main script
-def _message_graphs(conv_path, chat, date_filter, wordlist):
-    metrics = _parse_chat(chat, date_filter, wordlist)
+# the frames shown per month, they share one ColumnDataSource per person
+MONTH_FRAMES = (
+    "frame_months",
+    "frame_months_chars",
+    "frame_months_reply_time",
+    "frame_months_median_reply_time",
+    "frame_months_new_initiation",
+    "frame_months_pictures",
+    "frame_months_calls",
+    "frame_months_call_duration",
+    "frame_months_word_occurrence",
+)
+
+
+"""
+@input  metrics (dict)  output of _build_frames
+@input  keys    (list)  the frames to put into the sources
+@output sources (dict)  person -> ColumnDataSource with a column per frame
+
+In a dashboard every monthly plot reads its column of the same source, so
+the month index and the data of each person are only written once.
+"""
+
+
+def _month_sources(metrics, keys):
+    sources = {}
+    for person in ("A", "B"):
+        index = pd.DatetimeIndex([])
+        for key in keys:
+            index = index.union(pd.DatetimeIndex(metrics[person][key].index))
+        data = {"index": index}
+        for key in keys:
+            frame = metrics[person][key]
+            frame.index = pd.DatetimeIndex(frame.index)
+            data[key] = frame["frequency"].reindex(index, fill_value=0).values
+        sources[person] = ColumnDataSource(data=data)
+    return sources
+
 
-    histogram_month(conv_path,
+"""
+@input  wordlist (list)
+@output plots    (list)  (filename, tab title, function, arguments) of every plot
+
+The figures are built by function(metrics, *arguments), in the process that
+saves them.
+"""
+
+
+def _plots(wordlist):
+    plots = []
+    plots.append((
         "plot_month.html",
-        metrics,
-        "frame_months",
-        "Monthly message count over time per person",
-        "Message count",
-    )
-    histogram_month(conv_path,
+        "Messages",
+        histogram_month,
+        (
+            "frame_months",
+            "Monthly message count over time per person",
+            "Message count",
+        ),
+    ))
+    plots.append((
         "plot_month_replytime.html",
-        metrics,
-        "frame_months_reply_time",
-        "Average monthly reply delay time over time per person",
-        "average delay in seconds",
-    )
-    histogram_month(conv_path,
+        "Reply time",
+        histogram_month,
+        (
+            "frame_months_reply_time",
+            "Average monthly reply delay time over time per person",
+            "average delay in seconds",
+        ),
+    ))
+    plots.append((
+        "plot_month_replytime_median.html",
+        "Median reply time",
+        histogram_month,
+        (
+            "frame_months_median_reply_time",
+            "Median monthly reply delay time over time per person",
+            "median delay in seconds",
+        ),
+    ))
+    plots.append((
         "plot_month_new_initiation.html",
-        metrics,
-        "frame_months_new_initiation",
-        "Monthly new initiation count over time per person",
-        "initiation count",
-    )
-    # histogram_month(conv_path,
+        "Initiations",
+        histogram_month,
+        (
+            "frame_months_new_initiation",
+            "Monthly new initiation count over time per person",
+            "initiation count",
+        ),
+    ))
+    # plots.append((
     #     "plot_month_calls.html",
-    #     metrics,
-    #     "frame_months_calls",
-    #     "Number of calls per month (both persons)",
-    #     "Amount",
-    # )
-    # histogram_month(conv_path,
+    #     "Calls",
+    #     histogram_month,
+    #     (
+    #         "frame_months_calls",
+    #         "Number of calls per month (both persons)",
+    #         "Amount",
+    #     ),
+    # ))
+    # plots.append((
     #     "plot_month_call_time.html",
-    #     metrics,
-    #     "frame_months_call_duration",
-    #     "Total time on call per month (both persons)",
-    #     "total time in seconds",
-    # )
-    histogram_month(conv_path,
+    #     "Call time",
+    #     histogram_month,
+    #     (
+    #         "frame_months_call_duration",
+    #         "Total time on call per month (both persons)",
+    #         "total time in seconds",
+    #     ),
+    # ))
+    plots.append((
         "plot_month_photos.html",
-        metrics,
-        "frame_months_pictures",
-        "Monthly photo count over time per person",
-        "number of photos sent",
-    )
-    histogram_month(conv_path,
+        "Photos",
+        histogram_month,
+        (
+            "frame_months_pictures",
+            "Monthly photo count over time per person",
+            "number of photos sent",
+        ),
+    ))
+    plots.append((
         "plot_month_word_occurrence.html",
-        metrics,
-        "frame_months_word_occurrence",
-        "Occurrences of the strings: [" + ";\n".join(wordlist) + "]",
-        "number of occurrences",
-    )
-    histogram_weekdays(conv_path, "plot_weekdays.html", metrics)
-
-    histogram_hourofday(conv_path,
+        "Word occurrences",
+        histogram_month,
+        (
+            "frame_months_word_occurrence",
+            "Occurrences of the strings: [" + ";\n".join(wordlist) + "]",
+            "number of occurrences",
+        ),
+    ))
+    plots.append(("plot_weekdays.html", "Weekdays", histogram_weekdays, ()))
+    plots.append((
         "plot_hoursofday_messages.html",
-        metrics,
-        "frame_hoursofday",
-        "Message count distribution throughout the day",
-        "message count",
-    )
-    # histogram_hourofday(
+        "Hours",
+        histogram_hourofday,
+        (
+            "frame_hoursofday",
+            "Message count distribution throughout the day",
+            "message count",
+        ),
+    ))
+    # plots.append((
     #     "plot_hoursofday_calls.html",
-    #     metrics,
-    #     "frame_call_hoursofday",
-    #     "Call distribution throughout the day",
-    #     "number of calls",
-    # )
+    #     "Call hours",
+    #     histogram_hourofday,
+    #     (
+    #         "frame_call_hoursofday",
+    #         "Call distribution throughout the day",
+    #         "number of calls",
+    #     ),
+    # ))
+    plots.append((
+        "plot_month_characters.html",
+        "Characters",
+        histogram_month,
+        (
+            "frame_months_chars",
+            "Monthly character count over time per person",
+            "Number of characters",
+        ),
+    ))
+    # plots.append(("plot_days_characters.html", "Daily characters", histogram_days_chars, ()))
+    return plots
+
+
+# the names and frames of both persons, all the plots need
+def _plot_data(metrics):
+    data = {}
+    for person in ("A", "B"):
+        data[person] = {}
+        for key, entry in metrics[person].items():
+            if key == "name" or key.startswith("frame_"):
+                data[person][key] = entry
+    return data
+
+
+# builds and saves one plot, runs in the worker processes of _message_graphs()
+def _render(conv_path, data, plot, show, resources):
+    global open_browser, resources_mode
+    open_browser = show
+    resources_mode = resources
+    filename, title, build, arguments = plot
+    _output(build(data, *arguments), "__generated__/" + conv_path + "/" + filename, filename)
+    return filename
+
 
-    histogram_month_chars(conv_path, "plot_month_characters.html", metrics)
-    # histogram_days_chars(conv_path, "plot_days_characters.html", metrics)
+"""
+@input  conv_path  (str)
+@input  metrics    (dict)  output of _message_aggregate.aggregate
+@input  wordlist   (list)
+@input  show       (bool)  open the plots in the browser
+@input  dashboard  (bool)  all plots as tabs of one dashboard.html instead of one file each
+@input  resources  (str)   "cdn" or "inline" BokehJS
+@input  jobs       (int)   worker processes that render the separate files
+@output metrics    (dict)  with the frames of the plots
+
+Separate plots do not share anything once the frames are built, so every
+file is built and serialized by its own worker. A dashboard is a single
+document and is always rendered here.
+"""
 
+
+# called by the main script
+def _message_graphs(
+    conv_path,
+    metrics,
+    wordlist,
+    show=True,
+    dashboard=False,
+    resources="cdn",
+    jobs=1,
+):
+    global open_browser, resources_mode
+    open_browser = show
+    resources_mode = resources
+    metrics = _build_frames(metrics)
+    plots = _plots(wordlist)
+
+    if dashboard:
+        data = _plot_data(metrics)
+        # every monthly plot reads its column of the same sources
+        data["month_sources"] = _month_sources(data, MONTH_FRAMES)
+        tabs = []
+        for filename, title, build, arguments in plots:
+            tabs.append(Panel(child=build(data, *arguments), title=title))
+        _output(Tabs(tabs=tabs), "__generated__/" + conv_path + "/dashboard.html", "dashboard.html")
+    elif jobs > 1:
+        data = _plot_data(metrics)
+        with ProcessPoolExecutor(max_workers=min(jobs, len(plots))) as pool:
+            futures = [
+                pool.submit(_render, conv_path, data, plot, show, resources)
+                for plot in plots
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for plot in plots:
+            _render(conv_path, metrics, plot, show, resources)
     return metrics
 
 
-def histogram_month_chars(conv_path, filename, metrics):
-    bkh.reset_output()
-    bkh.output_file("__generated__/" + conv_path + "/" + filename, title=filename)
-    fig = bkh.figure(
-        x_axis_type="datetime",
-        title="Monthly character count over time per person",
-        width=720,
-        height=480,
-    )
+# month plots read the column <key> of the shared sources of a dashboard,
+# a bokeh model belongs to one document so separate files get their own
+def histogram_month(metrics, key, title_str, ylabel):
+    sources = metrics.get("month_sources")
+    if sources is None:
+        sources = _month_sources(metrics, (key,))
+    fig = bkh.figure(x_axis_type="datetime", title=title_str, width=720, height=480)
     fig.vbar(
         x="index",
-        top="frequency",
+        top=key,
         width=timedelta(days=10),
-        source=metrics["A"]["frame_months_chars"],
+        source=sources["A"],
         color=colors[0],
         legend_label=metrics["A"]["name"],
     )
     fig.vbar(
         x="index",
-        top="frequency",
+        top=key,
         width=timedelta(days=10),
-        source=metrics["B"]["frame_months_chars"],
+        source=sources["B"],
         color=colors[1],
         legend_label=metrics["B"]["name"],
     )
     fig.xaxis.axis_label = "Date"
-    fig.yaxis.axis_label = "Number of characters"
-    bkh.show(fig)
-    return
+    fig.yaxis.axis_label = ylabel
+    return fig
 
 
-def histogram_days_chars(conv_path, filename, metrics):
-    bkh.reset_output()
-    bkh.output_file("__generated__/" + conv_path + "/" + filename, title=filename)
+def histogram_days_chars(metrics):
     fig = bkh.figure(
         x_axis_type="datetime",
         title="Daily character count over time per person",
@@ -434,45 +463,10 @@ def histogram_days_chars(conv_path, filename, metrics):
     )
     fig.xaxis.axis_label = "Date"
     fig.yaxis.axis_label = "Number of characters"
-    bkh.show(fig)
-    return
-
-
-
-def histogram_month(conv_path, filename, metrics, key, title_str, ylabel):
-    bkh.reset_output()
-    bkh.output_file("__generated__/" + conv_path + "/" + filename, title=filename)
-    data_months = {
-        "index": metrics["A"][key].index,
-        metrics["A"]["name"]: metrics["A"]["frame_months"].frequency,
-        metrics["B"]["name"]: metrics["B"][key].frequency,
-    }
-    fig = bkh.figure(x_axis_type="datetime", title=title_str, width=720, height=480)
-    fig.vbar(
-        x="index",
-        top="frequency",
-        width=timedelta(days=10),
-        source=metrics["A"][key],
-        color=colors[0],
-        legend_label=metrics["A"]["name"],
-    )
-    fig.vbar(
-        x="index",
-        top="frequency",
-        width=timedelta(days=10),
-        source=metrics["B"][key],
-        color=colors[1],
-        legend_label=metrics["B"]["name"],
-    )
-    fig.xaxis.axis_label = "Date"
-    fig.yaxis.axis_label = ylabel
-    bkh.show(fig)
-    return
+    return fig
 
 
-def histogram_days(conv_path, filename, metrics, key, title_str, ylabel):
-    bkh.reset_output()
-    bkh.output_file("__generated__/" + conv_path + "/" + filename, title=filename)
+def histogram_days(metrics, key, title_str, ylabel):
     fig = bkh.figure(x_axis_type="datetime", title=title_str, width=720, height=480)
     fig.vbar(
         x="index",
@@ -492,14 +486,10 @@ def histogram_days(conv_path, filename, metrics, key, title_str, ylabel):
     )
     fig.xaxis.axis_label = "Date"
     fig.yaxis.axis_label = ylabel
-    bkh.show(fig)
-    return
+    return fig
 
 
-
-def histogram_weekdays(conv_path, filename, metrics):
-    bkh.reset_output()
-    bkh.output_file("__generated__/" + conv_path + "/" + filename, title=filename)
+def histogram_weekdays(metrics):
     weekdays = [
         "Monday",
         "Tuesday",
@@ -533,14 +523,10 @@ def histogram_weekdays(conv_path, filename, metrics):
     )
     fig.xaxis.axis_label = "Weekday"
     fig.yaxis.axis_label = "Message count"
-    bkh.show(fig)
-    return
-
+    return fig
 
 
-def histogram_hourofday(conv_path, filename, metrics, key, title_str, ylabel):
-    bkh.reset_output()
-    bkh.output_file("__generated__/" + conv_path + "/" + filename, title=filename)
+def histogram_hourofday(metrics, key, title_str, ylabel):
     hours = [
         "00:00",
         "01:00",
@@ -586,5 +572,4 @@ def histogram_hourofday(conv_path, filename, metrics, key, title_str, ylabel):
     )
     fig.xaxis.axis_label = "Time"
     fig.yaxis.axis_label = ylabel
-    bkh.show(fig)
-    return
+    return fig
@@ -1,142 +1,72 @@
 #! /usr/bin/python3
 
-from collections import Counter
-from datetime import datetime
+from _message_text import sort_frequency, top_frequency
 
 
 """
-@input 	chat (dict)
+@input 	aggregated (dict)  output of _message_aggregate.aggregate
+@input 	limit (int)        length of the word and emoji lists
+@input 	full (bool)        complete sorted lists instead of the first <limit> entries
 @output metrics (dict)
 
 calculates all the numerical metrics
 """
 
+NUMERIC_KEYS = (
+    "name",
+    "media",
+    "total_messages",
+    "total_words",
+    "total_chars",
+    "photo",
+    "urls",
+    "markdown",
+    "word_occurrences",
+    "reply_time_percentiles",
+)
 
-def _message_numerics(chat, date_filter):
-    metrics = {}
-    metrics["A"] = {}
-    metrics["B"] = {}
-    metrics["A"]["text"] = ""
-    metrics["B"]["text"] = ""
-    metrics["A"]["media"] = {}
-    metrics["B"]["media"] = {}
-    # person A is the 2nd message (1st can be "joined telegram" which has no "from" key)
-    metrics["A"]["name"] = chat["messages"][1]["from"]
-    metrics["total"] = len(chat["messages"])
-    oldest_date = datetime.strptime(date_filter, "%Y-%m-%d")
-
-    for message in chat["messages"]:
-        if message["type"] == "message":  # there are other types like calls
-            person = "B"
-            if metrics["A"]["name"] in message["from"]:
-                person = "A"
-            date_obj = datetime.strptime(message["date"], "%Y-%m-%dT%H:%M:%S")
-            if date_obj >= oldest_date:
-                metrics[person]["name"] = message["from"]
-                metrics[person]["total_messages"] = (
-                    metrics[person].get("total_messages", 0) + 1
-                )  # count messages
-                if (
-                    "media_type" in message
-                ):  # automatically count the different media types
-                    metrics[person]["media"][message["media_type"]] = (
-                        metrics[person]["media"].get(message["media_type"], 0) + 1
-                    )
-                if "photo" in message:
-                    metrics[person]["photo"] = metrics[person].get("photo", 0) + 1
-                if type(message["text"]) is list:  # multiple elements in one message
-                    used_markdown = False
-                    for line in message["text"]:
-                        if "type" in line and type(line) is dict:
-                            if line["type"] == "link":
-                                metrics[person]["urls"] = (
-                                    metrics[person].get("urls", 0) + 1
-                                )
-                            if (
-                                line["type"] == "pre"
-                                or line["type"] == "italic"
-                                or line["type"] == "bold"
-                            ):
-                                used_markdown = True  # only count markdown once per message, not per use
-                            metrics[person]["markdown"] = (
-                                metrics[person].get("markdown", 0) + used_markdown
-                            )
-                        elif type(line) is str:
-                            metrics[person]["text"] = (
-                                metrics[person].get("text", 0) + " " + line
-                            )
-                else:
-                    metrics[person]["text"] = (
-                        metrics[person].get("text", 0) + " " + message["text"]
-                    )
-
-    metrics["A"]["total_chars"] = len(metrics["A"]["text"])
-    metrics["B"]["total_chars"] = len(metrics["B"]["text"])
-    metrics["A"]["wordlist"] = count_word_frequency(metrics["A"]["text"])
-    metrics["B"]["wordlist"] = count_word_frequency(metrics["B"]["text"])
-    metrics["A"]["total_words"] = count_words(metrics["A"]["text"])
-    metrics["B"]["total_words"] = count_words(metrics["B"]["text"])
-    metrics["words"] = count_word_frequency(
-        metrics["A"]["text"] + " \n" + metrics["B"]["text"]
-    )
-    metrics["unique_words"] = len(metrics["words"])
-    metrics["A"]["unique_words"] = len(metrics["A"]["wordlist"])
-    metrics["B"]["unique_words"] = len(metrics["B"]["wordlist"])
-    metrics["A"]["emojilist"] = count_emojis(metrics["A"]["text"])
-    metrics["B"]["emojilist"] = count_emojis(metrics["B"]["text"])
-    metrics["A"]["avg_chars"] = (
-        metrics["A"]["total_chars"] / metrics["A"]["total_messages"]
-    )
-    metrics["B"]["avg_chars"] = (
-        metrics["B"]["total_chars"] / metrics["B"]["total_messages"]
-    )
-    metrics["A"]["avg_words"] = (
-        metrics["A"]["total_words"] / metrics["A"]["total_messages"]
-    )
-    metrics["B"]["avg_words"] = (
-        metrics["B"]["total_words"] / metrics["B"]["total_messages"]
-    )
-    return metrics
+# name of a person without messages or of a deleted account ("from": null)
+k_no_name = "(nobody)"
 
 
-def count_words(text):
-    text = text.lower()
-    words = text.split()
-    # remove non alphanumerics (this does not affect äöüéèà...)
-    for i in range(len(words)):
-        words[i] = "".join(e for e in words[i] if e.isalnum())
-    return len(words)
+def _frequency(counts, limit, full):
+    if full:
+        return sort_frequency(counts)
+    return top_frequency(counts, limit)
 
 
-def count_word_frequency(text):
-    text = text.lower()
-    words = text.split()
-    # remove non alphanumerics (this does not affect äöüéèà...)
-    for i in range(len(words)):
-        words[i] = "".join(e for e in words[i] if e.isalnum())
-    wordcount = len(words)
-    # count ocurrences of each word
-    wordlist = {}
-    for word in words:
-        if len(word) > 0:
-            wordlist[word] = wordlist.get(word, 0) + 1
-    # convert dict to list
-    wordfreq = []
-    for key, value in wordlist.items():
-        wordfreq.append((value, key))
-    wordfreq.sort(reverse=True)  # sort
-    return wordfreq
-
+def _message_numerics(aggregated, limit, full=False):
+    metrics = {}
+    for person in ("A", "B"):
+        metrics[person] = {}
+        for key in NUMERIC_KEYS:
+            if key in aggregated[person]:
+                metrics[person][key] = aggregated[person][key]
+    metrics["total"] = aggregated["total"]
+    for person in ("A", "B"):
+        monthly = {}
+        for month_obj, values in aggregated[person]["monthly_reply_time_percentiles"].items():
+            monthly[month_obj.strftime("%Y-%m")] = values
+        metrics[person]["monthly_reply_time_percentiles"] = monthly
 
-def count_emojis(text):
-    # count ocurrences of each word
-    emlist = {}
-    for em in text:
-        if len(em.encode("utf-8")) > 3:
-            emlist[em] = emlist.get(em, 0) + 1
-    # convert dict to list
-    emfreq = []
-    for key, value in emlist.items():
-        emfreq.append((value, key))
-    emfreq.sort(reverse=True)  # sort
-    return emfreq
+    for person in ("A", "B"):
+        word_counts = aggregated[person]["word_counts"]
+        metrics[person]["wordlist"] = _frequency(word_counts, limit, full)
+        # words with at least 5 characters
+        metrics[person]["bigwordlist"] = top_frequency(word_counts, limit, 5)
+        metrics[person]["unique_words"] = len(word_counts)
+        metrics[person]["emojilist"] = _frequency(
+            aggregated[person]["emoji_counts"], limit, full
+        )
+    # the combined vocabulary of both persons
+    words = aggregated["A"]["word_counts"] + aggregated["B"]["word_counts"]
+    metrics["words"] = _frequency(words, limit, full)
+    metrics["unique_words"] = len(words)
+    for person in ("A", "B"):
+        # a chat can have a single sender (saved messages, channels)
+        messages = metrics[person]["total_messages"]
+        metrics[person]["avg_chars"] = metrics[person]["total_chars"] / messages if messages else 0
+        metrics[person]["avg_words"] = metrics[person]["total_words"] / messages if messages else 0
+        if metrics[person].get("name") is None:
+            metrics[person]["name"] = k_no_name
+    return metrics
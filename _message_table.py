@@ -0,0 +1,169 @@
+#! /usr/bin/python3
+
+from array import array
+import numpy as np
+
+from _message_dates import decode_date, decode_unixtime
+
+
+"""
+Columnar representation of a chat.
+
+The messages are walked once and every field the metrics need is stored in
+a flat column, one row per message. All time bucket aggregation then runs
+as numpy operations over these columns instead of per message dict updates.
+
+columns:
+    id          int64   message id
+    seconds     int64   local time of the message (seconds since 1970-01-01)
+    unixtime    int64   "date_unixtime", or the local time for older exports
+    type        int8    MESSAGE, SERVICE or OTHER
+    sender      int32   index into table["senders"] ("from"), -1 if missing
+    author      int32   index into table["senders"] ("from" or "actor"), -1 if missing
+    chars       int64   number of characters of the text
+    photo       bool    message contains a photo
+    media       int16   index into table["media_types"], -1 if no media
+    links       int32   number of links in the text
+    markdown    int32   markdown count of the message (see _markdown)
+    duration    int64   duration of an answered phone call, -1 otherwise
+and the plain text of every message in table["text"] (list of str).
+"""
+
+MESSAGE = 0
+SERVICE = 1
+OTHER = 2
+
+_types = {"message": MESSAGE, "service": SERVICE}
+
+COLUMNS = (
+    ("id", "q", np.int64),
+    ("seconds", "q", np.int64),
+    ("unixtime", "q", np.int64),
+    ("type", "b", np.int8),
+    ("sender", "l", np.int32),
+    ("author", "l", np.int32),
+    ("chars", "q", np.int64),
+    ("photo", "b", np.bool_),
+    ("media", "h", np.int16),
+    ("links", "l", np.int32),
+    ("markdown", "l", np.int32),
+    ("duration", "q", np.int64),
+)
+
+
+def _code(codes, names, name):
+    code = codes.get(name)
+    if code is None:
+        code = len(names)
+        codes[name] = code
+        names.append(name)
+    return code
+
+
+# markdown is counted once per text entity following the first pre/italic/bold
+# entity of a message, the way it has always been reported in raw_metrics.json
+def _markdown(entities):
+    count = 0
+    used_markdown = False
+    for entity in entities:
+        if entity.get("type") in ("pre", "italic", "bold"):
+            used_markdown = True
+        count += used_markdown
+    return count
+
+
+"""
+@input  messages (iterable)  messages of one chat, can be a generator
+@output table    (dict)      numpy columns plus "text", "senders", "media_types"
+"""
+
+
+def build_table(messages):
+    columns = {}
+    for name, typecode, dtype in COLUMNS:
+        columns[name] = array(typecode)
+    texts = []
+    senders = []
+    sender_codes = {}
+    media_types = []
+    media_codes = {}
+
+    # local names for the hot loop
+    append_id = columns["id"].append
+    append_seconds = columns["seconds"].append
+    append_unixtime = columns["unixtime"].append
+    append_type = columns["type"].append
+    append_sender = columns["sender"].append
+    append_author = columns["author"].append
+    append_chars = columns["chars"].append
+    append_photo = columns["photo"].append
+    append_media = columns["media"].append
+    append_links = columns["links"].append
+    append_markdown = columns["markdown"].append
+    append_duration = columns["duration"].append
+    append_text = texts.append
+
+    for message in messages:
+        seconds = decode_date(message["date"])[1]
+        append_id(message.get("id", -1))
+        append_seconds(seconds)
+        append_unixtime(decode_unixtime(message, seconds))
+        append_type(_types.get(message["type"], OTHER))
+
+        sender = -1
+        author = -1
+        if "from" in message:
+            sender = _code(sender_codes, senders, message["from"])
+            author = sender
+        elif "actor" in message:
+            author = _code(sender_codes, senders, message["actor"])
+        append_sender(sender)
+        append_author(author)
+
+        text = message.get("text", "")
+        chars = 0
+        links = 0
+        markdown = 0
+        if type(text) is list:  # multiple elements in one message
+            lines = []
+            entities = []
+            for line in text:
+                if type(line) is str:
+                    lines.append(line)
+                elif type(line) is dict and "type" in line:
+                    entities.append(line)
+                    if line["type"] == "link":
+                        links += 1
+            if entities:
+                markdown = _markdown(entities)
+            for line in lines:
+                chars += len(line)
+            text = " ".join(lines)
+        elif type(text) is str:
+            chars = len(text)
+        else:
+            text = ""
+        append_text(text)
+        append_chars(chars)
+        append_links(links)
+        append_markdown(markdown)
+
+        append_photo("photo" in message)
+        if "media_type" in message:
+            append_media(_code(media_codes, media_types, message["media_type"]))
+        else:
+            append_media(-1)
+        if message.get("action") == "phone_call" and "duration_seconds" in message:
+            append_duration(int(message["duration_seconds"]))
+        else:
+            append_duration(-1)
+
+    table = {}
+    for name, typecode, dtype in COLUMNS:
+        table[name] = np.frombuffer(columns[name], dtype=np.dtype(typecode)).astype(
+            dtype
+        )
+    table["text"] = texts
+    table["senders"] = senders
+    table["media_types"] = media_types
+    return table
@@ -0,0 +1,213 @@
+#! /usr/bin/python3
+
+import heapq
+import re
+
+
+"""
+Tokenizer and counters for the text of the messages.
+
+A word is a whitespace separated token, lowercased and stripped of every
+character that is not alphanumeric (this does not affect äöüéèà...).
+An emoji is a whole grapheme, so skin tones, flags and zwj sequences like
+families count as one emoji, matched with a pattern compiled from the
+code point tables below.
+The counts are kept in collections.Counter objects, filled per message.
+"""
+
+# everything that is neither alphanumeric nor whitespace
+_non_alnum = re.compile(r"[^\w\s]|_")
+
+# code points that are shown as emoji on their own
+EMOJI_RANGES = (
+    (0x231A, 0x231B),
+    (0x23E9, 0x23EC),
+    (0x23F0, 0x23F0),
+    (0x23F3, 0x23F3),
+    (0x25FD, 0x25FE),
+    # miscellaneous symbols and dingbats with Emoji_Presentation
+    (0x2614, 0x2615),
+    (0x2648, 0x2653),
+    (0x267F, 0x267F),
+    (0x2693, 0x2693),
+    (0x26A1, 0x26A1),
+    (0x26AA, 0x26AB),
+    (0x26BD, 0x26BE),
+    (0x26C4, 0x26C5),
+    (0x26CE, 0x26CE),
+    (0x26D4, 0x26D4),
+    (0x26EA, 0x26EA),
+    (0x26F2, 0x26F3),
+    (0x26F5, 0x26F5),
+    (0x26FA, 0x26FA),
+    (0x26FD, 0x26FD),
+    (0x2705, 0x2705),
+    (0x270A, 0x270B),
+    (0x2728, 0x2728),
+    (0x274C, 0x274C),
+    (0x274E, 0x274E),
+    (0x2753, 0x2755),
+    (0x2757, 0x2757),
+    (0x2795, 0x2797),
+    (0x27B0, 0x27B0),
+    (0x27BF, 0x27BF),
+    (0x2B1B, 0x2B1C),
+    (0x2B50, 0x2B50),
+    (0x2B55, 0x2B55),
+    (0x1F000, 0x1F1E5),
+    (0x1F200, 0x1F3FA),
+    (0x1F400, 0x1FAFF),
+)
+# code points that are only emoji when followed by the variation selector U+FE0F
+# (or a skin tone), plain symbols like ✓ ★ ♪ are in neither table
+TEXT_EMOJI_RANGES = (
+    (0x00A9, 0x00A9),
+    (0x00AE, 0x00AE),
+    (0x203C, 0x203C),
+    (0x2049, 0x2049),
+    (0x2122, 0x2122),
+    (0x2139, 0x2139),
+    (0x2194, 0x2199),
+    (0x21A9, 0x21AA),
+    (0x2328, 0x2328),
+    (0x23CF, 0x23CF),
+    (0x23ED, 0x23EF),
+    (0x23F1, 0x23F2),
+    (0x23F8, 0x23FA),
+    (0x24C2, 0x24C2),
+    (0x25AA, 0x25AB),
+    (0x25B6, 0x25B6),
+    (0x25C0, 0x25C0),
+    (0x25FB, 0x25FC),
+    # miscellaneous symbols and dingbats: ☀ ☎ ☺ ♥ ✈ ✔ ❤ ...
+    (0x2600, 0x2604),
+    (0x260E, 0x260E),
+    (0x2611, 0x2611),
+    (0x2618, 0x2618),
+    (0x261D, 0x261D),
+    (0x2620, 0x2620),
+    (0x2622, 0x2623),
+    (0x2626, 0x2626),
+    (0x262A, 0x262A),
+    (0x262E, 0x262F),
+    (0x2638, 0x263A),
+    (0x2640, 0x2640),
+    (0x2642, 0x2642),
+    (0x265F, 0x2660),
+    (0x2663, 0x2663),
+    (0x2665, 0x2666),
+    (0x2668, 0x2668),
+    (0x267B, 0x267B),
+    (0x267E, 0x267E),
+    (0x2692, 0x2692),
+    (0x2694, 0x2697),
+    (0x2699, 0x2699),
+    (0x269B, 0x269C),
+    (0x26A0, 0x26A0),
+    (0x26A7, 0x26A7),
+    (0x26B0, 0x26B1),
+    (0x26C8, 0x26C8),
+    (0x26CF, 0x26CF),
+    (0x26D1, 0x26D1),
+    (0x26D3, 0x26D3),
+    (0x26E9, 0x26E9),
+    (0x26F0, 0x26F1),
+    (0x26F4, 0x26F4),
+    (0x26F7, 0x26F9),
+    (0x2702, 0x2702),
+    (0x2708, 0x2709),
+    (0x270C, 0x270D),
+    (0x270F, 0x270F),
+    (0x2712, 0x2712),
+    (0x2714, 0x2714),
+    (0x2716, 0x2716),
+    (0x271D, 0x271D),
+    (0x2721, 0x2721),
+    (0x2733, 0x2734),
+    (0x2744, 0x2744),
+    (0x2747, 0x2747),
+    (0x2763, 0x2764),
+    (0x27A1, 0x27A1),
+    (0x2934, 0x2935),
+    (0x2B05, 0x2B07),
+    (0x3030, 0x3030),
+    (0x303D, 0x303D),
+    (0x3297, 0x3297),
+    (0x3299, 0x3299),
+)
+
+
+def _char_class(ranges):
+    parts = []
+    for first, last in ranges:
+        parts.append(re.escape(chr(first)))
+        if last != first:
+            parts.append("-" + re.escape(chr(last)))
+    return "[" + "".join(parts) + "]"
+
+
+# one emoji: a pictograph with optional skin tone, variation selector, keycap
+# or tag sequence (subdivision flags), text symbols need U+FE0F or a skin tone
+_emoji_element = (
+    "(?:"
+    + _char_class(EMOJI_RANGES)
+    + "|"
+    + _char_class(TEXT_EMOJI_RANGES)
+    + "(?=[\uFE0F\U0001F3FB-\U0001F3FF]))"
+    + "[\U0001F3FB-\U0001F3FF]?\uFE0F?\u20E3?"
+    + "(?:[\U000E0020-\U000E007E]+\U000E007F)?"
+)
+# a grapheme: zwj sequences (families, professions, ...), flags and keycaps
+_emoji = re.compile(
+    _emoji_element
+    + "(?:\u200D"
+    + _emoji_element
+    + ")*"
+    + "|[\U0001F1E6-\U0001F1FF]{2}"
+    + "|[0-9#*]\uFE0F?\u20E3"
+)
+
+
+"""
+@input  text  (str)
+@output count (int)   number of tokens, including the ones without any alphanumerics
+@output words (list)  the cleaned, non empty words
+"""
+
+
+def tokenize(text):
+    text = text.lower()
+    count = len(text.split())
+    if _non_alnum.search(text) is not None:
+        text = _non_alnum.sub("", text)
+    return count, text.split()
+
+
+# adds the words of one message to word_counts (Counter), returns the number of words
+def count_words(text, word_counts):
+    count, words = tokenize(text)
+    word_counts.update(words)
+    return count
+
+
+# adds the emojis of one message to emoji_counts (Counter)
+def count_emojis(text, emoji_counts):
+    if text.isascii():
+        return
+    emoji_counts.update(_emoji.findall(text))
+
+
+# converts counts to a list of (count, key) sorted by count
+def sort_frequency(counts):
+    freq = [(value, key) for key, value in counts.items()]
+    freq.sort(reverse=True)  # sort
+    return freq
+
+
+# the first entries of sort_frequency() without sorting all the others
+def top_frequency(counts, limit, min_length=0):
+    if min_length > 0:
+        entries = ((value, key) for key, value in counts.items() if len(key) >= min_length)
+    else:
+        entries = ((value, key) for key, value in counts.items())
+    return heapq.nlargest(limit, entries)
@@ -0,0 +1,80 @@
+#! /usr/bin/python3
+
+import math
+import numpy as np
+
+
+"""
+Mergeable quantile sketch for the reply times.
+
+The values are counted in logarithmic buckets (as in DDSketch): bucket i
+holds the values in (gamma^(i-1), gamma^i], so every quantile is returned
+with a relative error of at most k_relative_accuracy. The memory only grows
+with the logarithm of the value range, not with the number of values: reply
+times from 1 second to 5 hours fit into less than 500 buckets.
+
+Sketches with the same accuracy are merged by adding up their buckets, so
+shards and incremental runs can be combined without keeping the values.
+
+    sketch = {"count": int, "zeros": int, "bins": {bucket index: count}}
+"""
+
+k_relative_accuracy = 0.01
+_gamma = (1 + k_relative_accuracy) / (1 - k_relative_accuracy)
+_log_gamma = math.log(_gamma)
+
+PERCENTILES = (("median", 0.5), ("p90", 0.9), ("p99", 0.99))
+
+
+"""
+@input  values (array)  numbers >= 0, smaller ones count as 0
+@output sketch (dict)
+"""
+
+
+def sketch(values):
+    values = np.asarray(values, dtype=np.float64)
+    positive = values[values > 0]
+    indices, counts = np.unique(
+        np.ceil(np.log(positive) / _log_gamma).astype(np.int64), return_counts=True
+    )
+    result = {}
+    result["count"] = len(values)
+    result["zeros"] = len(values) - len(positive)
+    result["bins"] = dict(zip(indices.tolist(), counts.tolist()))
+    return result
+
+
+def merge_sketches(first, second):
+    merged = {}
+    merged["count"] = first["count"] + second["count"]
+    merged["zeros"] = first["zeros"] + second["zeros"]
+    bins = dict(first["bins"])
+    for index, count in second["bins"].items():
+        bins[index] = bins.get(index, 0) + count
+    merged["bins"] = bins
+    return merged
+
+
+# value at rank q (0 <= q <= 1), None for an empty sketch
+def quantile(sketch, q):
+    if sketch["count"] == 0:
+        return None
+    rank = q * (sketch["count"] - 1)
+    seen = sketch["zeros"]
+    if rank < seen:
+        return 0.0
+    for index in sorted(sketch["bins"]):
+        seen += sketch["bins"][index]
+        if rank < seen:
+            # the estimate with the smallest relative error within the bucket
+            return 2 * _gamma ** index / (_gamma + 1)
+    return 2 * _gamma ** max(sketch["bins"]) / (_gamma + 1)
+
+
+# {"median": ..., "p90": ..., "p99": ...}
+def percentiles(sketch):
+    result = {}
+    for name, q in PERCENTILES:
+        result[name] = quantile(sketch, q)
+    return result
@@ -0,0 +1,111 @@
+#! /usr/bin/python3
+
+from datetime import date
+import gzip
+import json
+
+
+"""
+Compact raw output of the metrics.
+
+raw_metrics.ndjson.gz holds one json record per line, each one is a single
+named value:
+
+    {"name": "A.total_messages", "value": 1423}
+    {"name": "B.months", "value": {"2019-01-01": 119, ...}}
+    {"name": "words", "part": 0, "value": [[523, "the"], ...]}
+
+Long lists (the complete word lists of --full-wordlists) are split into parts
+of k_part_size entries, every record is encoded and written on its own, so
+the whole output is never built as one string. load_raw() reads the file line
+by line and only decodes the records that were asked for.
+No text of the messages is ever written.
+"""
+
+k_part_size = 10000
+
+# per person series of _message_aggregate.aggregate, keyed by month, day, weekday or hour
+SERIES_KEYS = (
+    "months",
+    "days",
+    "weekdays",
+    "hourofday",
+    "months_chars",
+    "days_chars",
+    "monthly_pictures",
+    "monthly_calls",
+    "monthly_call_duration",
+    "monthly_n_replied",
+    "monthly_time_to_reply",
+    "monthly_avg_reply_time",
+    "monthly_median_reply_time",
+    "monthly_new_initiation",
+    "monthly_word_occurrence",
+    "call_hourofday",
+)
+
+
+def _key(key):
+    if isinstance(key, date):
+        return key.strftime("%Y-%m-%d")
+    return str(key)
+
+
+def _records(metrics, aggregated):
+    yield "total", metrics["total"]
+    yield "unique_words", metrics["unique_words"]
+    yield "words", metrics["words"]
+    for person in ("A", "B"):
+        for key, value in metrics[person].items():
+            yield person + "." + key, value
+        for key in SERIES_KEYS:
+            series = {}
+            for bucket, value in aggregated[person].get(key, {}).items():
+                series[_key(bucket)] = value
+            yield person + "." + key, series
+
+
+"""
+@input  path       (str)
+@input  metrics    (dict)  output of _message_numerics
+@input  aggregated (dict)  output of _message_aggregate.aggregate, for the series
+"""
+
+
+def write_raw(path, metrics, aggregated):
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as fh:
+        for name, value in _records(metrics, aggregated):
+            if isinstance(value, list) and len(value) > k_part_size:
+                for part, start in enumerate(range(0, len(value), k_part_size)):
+                    record = {"name": name, "part": part, "value": value[start : start + k_part_size]}
+                    fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                record = {"name": name, "value": value}
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+"""
+@input  path   (str)
+@input  names  (list)  names of the records to load, None for all
+@output values (dict)  name -> value, lists written in parts are joined again
+"""
+
+
+def load_raw(path, names=None):
+    wanted = None
+    if names is not None:
+        wanted = set(names)
+    values = {}
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            # the name is the first key, skip the other records without decoding them
+            if wanted is not None:
+                name = line[len('{"name": ') :].split('"', 2)[1]
+                if name not in wanted:
+                    continue
+            record = json.loads(line)
+            if "part" in record and record["part"] > 0:
+                values[record["name"]].extend(record["value"])
+            else:
+                values[record["name"]] = record["value"]
+    return values
@@ -0,0 +1,119 @@
+#! /usr/bin/python3
+
+import csv
+from datetime import date
+
+
+"""
+All time series of a chat in one aligned table.
+
+Every row is one bucket of a time scale, every column one series of one
+person (the suffix _A or _B):
+
+    scale    bucket      messages_A  messages_B  chars_A  ...  calls_A  ...
+    month    2019-01-01  119         127         3914          4
+    ...
+    weekday  0           74          81
+    hour     0           12          9           (empty)       1
+
+The monthly series have a row for every month in which any series has a
+value, missing counts are 0. Columns that do not exist for a scale (or
+averages of months without replies) stay empty.
+The table is written as series.csv and, if pyarrow is installed, as
+series.parquet.
+"""
+
+# (column, key in _message_aggregate.aggregate) per scale
+MONTH_SERIES = (
+    ("messages", "months"),
+    ("chars", "months_chars"),
+    ("pictures", "monthly_pictures"),
+    ("calls", "monthly_calls"),
+    ("call_duration", "monthly_call_duration"),
+    ("replies", "monthly_n_replied"),
+    ("reply_time", "monthly_time_to_reply"),
+    ("avg_reply_time", "monthly_avg_reply_time"),
+    ("median_reply_time", "monthly_median_reply_time"),
+    ("initiations", "monthly_new_initiation"),
+    ("word_occurrences", "monthly_word_occurrence"),
+)
+WEEKDAY_SERIES = (("messages", "weekdays"),)
+HOUR_SERIES = (("messages", "hourofday"), ("calls", "call_hourofday"))
+
+SCALES = (("month", MONTH_SERIES), ("weekday", WEEKDAY_SERIES), ("hour", HOUR_SERIES))
+
+# averages are undefined for buckets without values, all other series count
+_averages = ("avg_reply_time", "median_reply_time")
+
+
+def _columns():
+    columns = []
+    for scale, series in SCALES:
+        for name, key in series:
+            for person in ("A", "B"):
+                if name + "_" + person not in columns:
+                    columns.append(name + "_" + person)
+    return columns
+
+
+def _bucket_name(bucket):
+    if isinstance(bucket, date):
+        return bucket.strftime("%Y-%m-%d")
+    return str(bucket)
+
+
+"""
+@input  aggregated (dict)  output of _message_aggregate.aggregate
+@output table      (dict)  column name -> list of values, in the order of the columns
+"""
+
+
+def series_table(aggregated):
+    columns = ["scale", "bucket"] + _columns()
+    table = {}
+    for column in columns:
+        table[column] = []
+    for scale, series in SCALES:
+        buckets = set()
+        for name, key in series:
+            for person in ("A", "B"):
+                buckets.update(aggregated[person][key])
+        for bucket in sorted(buckets):
+            row = dict.fromkeys(columns)
+            row["scale"] = scale
+            row["bucket"] = _bucket_name(bucket)
+            for name, key in series:
+                for person in ("A", "B"):
+                    default = None if name in _averages else 0
+                    row[name + "_" + person] = aggregated[person][key].get(bucket, default)
+            for column in columns:
+                table[column].append(row[column])
+    return table
+
+
+def _write_csv(path, table):
+    columns = list(table)
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh, delimiter=";")
+        writer.writerow(columns)
+        for row in zip(*(table[column] for column in columns)):
+            writer.writerow(["" if value is None else value for value in row])
+
+
+"""
+@input  directory  (str)   output directory of the chat
+@input  aggregated (dict)  output of _message_aggregate.aggregate
+@output formats    (list)  the formats that were written
+"""
+
+
+def write_series(directory, aggregated):
+    table = series_table(aggregated)
+    _write_csv(directory + "/series.csv", table)
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return ["csv"]
+    pyarrow.parquet.write_table(pyarrow.table(table), directory + "/series.parquet")
+    return ["csv", "parquet"]
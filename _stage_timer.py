@@ -0,0 +1,103 @@
+#! /usr/bin/python3
+
+from contextlib import contextmanager
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on windows
+    resource = None
+
+
+"""
+Wall time, CPU time and memory of the stages of a run.
+
+    stages = []
+    with stage(stages, "aggregate", messages=len(table["type"])):
+        aggregated = aggregate(...)
+
+Every stage appends one record to the list:
+
+    {"stage": "aggregate", "wall": 1.93, "cpu": 1.91, "cpu_children": 0.0,
+     "messages": 300000, "messages_per_second": 155440, "max_rss": 181403648}
+
+The record is yielded, so the caller can add its own values to it (also
+"messages", if the count is only known at the end of the stage).
+cpu is the time of this process, cpu_children the time of the worker
+processes that ended during the stage. max_rss is the largest resident size
+of the process so far, in bytes. If tracemalloc is tracing, peak_traced is
+the highest memory allocated by Python during the stage (including what was
+allocated before and is still in use).
+If a dict is passed as profilers, the stage runs under cProfile and its
+profiler is kept there by the name of the stage (see write_profile()).
+"""
+
+
+def _children_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@contextmanager
+def stage(stages, name, messages=None, profilers=None):
+    record = {"stage": name}
+    if messages is not None:
+        record["messages"] = messages
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    profiler = None
+    if profilers is not None:
+        profiler = cProfile.Profile()
+        profilers[name] = profiler
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    children = _children_cpu()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record["wall"] = round(time.perf_counter() - wall, 6)
+        record["cpu"] = round(time.process_time() - cpu, 6)
+        record["cpu_children"] = round(_children_cpu() - children, 6)
+        if record.get("messages") is not None and record["wall"] > 0:
+            record["messages_per_second"] = round(record["messages"] / record["wall"])
+        max_rss = _max_rss()
+        if max_rss is not None:
+            record["max_rss"] = max_rss
+        if tracing:
+            record["peak_traced"] = tracemalloc.get_traced_memory()[1]
+        stages.append(record)
+
+
+"""
+@input  directory (str)   output directory
+@input  stages    (list)  records of stage()
+@input  profilers (dict)  cProfile profilers of stage(), None for none
+
+Writes profile.json and, for every profiled stage, profile_<stage>.prof
+(readable with python3 -m pstats or snakeviz).
+"""
+
+
+def write_profile(directory, stages, profilers=None):
+    with open(os.path.join(directory, "profile.json"), "w", encoding="utf-8") as fh:
+        json.dump({"stages": stages}, fh, indent=4)
+    for name, profiler in (profilers or {}).items():
+        profiler.dump_stats(os.path.join(directory, "profile_" + name + ".prof"))
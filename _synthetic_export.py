@@ -0,0 +1,145 @@
+#! /usr/bin/python3
+
+from datetime import datetime, timezone
+import json
+import random
+
+
+"""
+Reproducible synthetic Telegram exports for the benchmarks.
+
+The same options and seed always give the same file. The messages are
+written one at a time, so exports of any size can be generated without
+holding them in memory.
+
+options (see DEFAULTS):
+    messages       number of messages of the first chat
+    chats          number of chats, every further chat has half the messages
+    senders        2 for a personal chat, more for a group chat
+    words          mean number of words of a text (exponentially distributed)
+    emoji_density  chance of every word to be an emoji instead
+    list_text      share of texts written as a list with entities (bold, links)
+    photo          share of messages with a photo
+    media          share of messages with a sticker, voice or video message
+    call           share of service messages that are phone calls
+    service        share of other service messages
+    gap            mean seconds between two messages
+    seed           seed of the random generator
+"""
+
+DEFAULTS = {
+    "messages": 10000,
+    "chats": 1,
+    "senders": 2,
+    "words": 8,
+    "emoji_density": 0.05,
+    "list_text": 0.1,
+    "photo": 0.05,
+    "media": 0.03,
+    "call": 0.01,
+    "service": 0.005,
+    "gap": 600,
+    "seed": 1,
+}
+
+WORDS = (
+    "hello", "ciao", "world", "yes", "no", "ok", "vacation", "john", "pizza",
+    "tomorrow", "morning", "evening", "weekend", "später", "très", "bien",
+    "love", "work", "home", "train", "coffee", "what?", "really!", "haha",
+)
+EMOJIS = ("😘", "👍🏽", "😂", "❤️", "🇮🇹", "👨‍👩‍👧", "🥰", "🙈", "#️⃣")
+MEDIA_TYPES = ("sticker", "voice_message", "video_message", "animation")
+# 2019-01-01 00:00:00 UTC
+START = 1546300800
+
+
+def _text(rng, options):
+    count = max(1, int(rng.expovariate(1 / options["words"])))
+    words = []
+    for _ in range(count):
+        if rng.random() < options["emoji_density"]:
+            words.append(rng.choice(EMOJIS))
+        else:
+            words.append(rng.choice(WORDS))
+    text = " ".join(words)
+    if rng.random() < options["list_text"]:
+        return [
+            text,
+            {"type": "bold", "text": rng.choice(WORDS)},
+            " ",
+            {"type": "link", "text": "https://example.org/" + rng.choice(WORDS)},
+        ]
+    return text
+
+
+def _message(rng, options, id, unixtime, senders):
+    date = datetime.fromtimestamp(unixtime, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    sender = rng.choice(senders)
+    message = {"id": id, "date": date, "date_unixtime": str(unixtime)}
+    chance = rng.random()
+    if chance < options["call"]:
+        message["type"] = "service"
+        message["actor"] = sender
+        message["action"] = "phone_call"
+        if rng.random() < 0.8:
+            message["duration_seconds"] = rng.randint(5, 3600)
+        message["text"] = ""
+        return message
+    if chance < options["call"] + options["service"]:
+        message["type"] = "service"
+        message["actor"] = sender
+        message["action"] = "pin_message"
+        message["text"] = ""
+        return message
+    message["type"] = "message"
+    message["from"] = sender
+    message["from_id"] = "user" + str(senders.index(sender))
+    chance = rng.random()
+    if chance < options["photo"]:
+        message["photo"] = "photos/photo_" + str(id) + ".jpg"
+        message["text"] = ""
+    elif chance < options["photo"] + options["media"]:
+        message["media_type"] = rng.choice(MEDIA_TYPES)
+        message["text"] = ""
+    else:
+        message["text"] = _text(rng, options)
+    return message
+
+
+def _write_chat(fh, rng, options, id, count):
+    senders = ["Me"] + ["Person " + str(id) + "." + str(i) for i in range(1, options["senders"])]
+    chat = {"name": senders[1], "type": "personal_chat", "id": id}
+    if options["senders"] > 2:
+        chat["name"] = "Group " + str(id)
+        chat["type"] = "private_group"
+    fh.write(json.dumps(chat, ensure_ascii=False)[:-1] + ', "messages": [')
+    unixtime = START
+    for index in range(count):
+        unixtime += int(rng.expovariate(1 / options["gap"]))
+        if index > 0:
+            fh.write(",")
+        fh.write("\n" + json.dumps(_message(rng, options, index + 1, unixtime, senders), ensure_ascii=False))
+    fh.write("\n]}")
+
+
+"""
+@input  path    (str)   the result.json to write
+@input  options (dict)  overrides of DEFAULTS
+@output options (dict)  all options that were used
+"""
+
+
+def write_export(path, options=None):
+    used = dict(DEFAULTS)
+    used.update(options or {})
+    rng = random.Random(used["seed"])
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write('{"about": "synthetic export", "chats": {"about": "", "list": [')
+        count = used["messages"]
+        for index in range(used["chats"]):
+            if index > 0:
+                fh.write(",")
+            _write_chat(fh, rng, used, index + 1, count)
+            count = max(1, count // 2)
+        fh.write("]}}\n")
+    return used
@@ -0,0 +1,74 @@
+#! /usr/bin/python3
+
+import re
+
+
+"""
+Streaming reader for WhatsApp chat exports ("WhatsApp Chat with Name.txt").
+
+    [2019-05-30, 12:34:56] Name Surname: first line of the text
+    second line of the same message
+    [2019-05-30, 12:35:10] Other Name: next message
+
+The export is read line by line with a small state machine: a line starting
+with a [date, time] header starts a new message, every other line continues
+the text of the current one. Only the message being read is held in memory.
+Header lines without a sender ("Messages are end-to-end encrypted", "Name
+added Other") are system notes, they are skipped with their continuation
+lines.
+"""
+
+# byte order mark and the left-to-right mark WhatsApp puts in front of some lines
+_marks = "\ufeff\u200e"
+_header = re.compile(r"\[(\d+)-(\d+)-(\d+), (\d+):(\d+):(\d\d)[^\]]*\] ?")
+
+CHAT = {"name": "unknown", "type": "personal_chat", "id": 1}
+
+
+def is_header(line):
+    return _header.match(line.lstrip(_marks)) is not None
+
+
+def _message(id, match, rest):
+    name, text = rest.split(":", 1)
+    message = {}
+    message["id"] = id
+    message["type"] = "message"
+    message["date"] = "%04d-%02d-%02dT%02d:%02d:%02d" % tuple(
+        int(value) for value in match.groups()
+    )
+    message["edited"] = "1970-01-01T01:00:00"
+    message["from"] = name.strip()
+    return message, [text]
+
+
+"""
+@input  lines    (iterable)   lines of the export, e.g. the open file
+@output messages (generator)  Telegram style messages (id, type, date, from, text)
+"""
+
+
+def iter_messages(lines):
+    id = 0
+    message = None
+    text = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = _header.match(line.lstrip(_marks))
+        if match is None:
+            # continuation of the current message (or of a skipped system note)
+            if message is not None:
+                text.append(line)
+            continue
+        if message is not None:
+            message["text"] = "\n".join(text).strip()
+            yield message
+            message = None
+        rest = line.lstrip(_marks)[match.end() :]
+        if ":" not in rest:
+            continue
+        message, text = _message(id, match, rest)
+        id += 1
+    if message is not None:
+        message["text"] = "\n".join(text).strip()
+        yield message
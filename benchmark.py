@@ -0,0 +1,246 @@
+#! /usr/bin/python3
+
+# _*_ coding: utf-8 _*_
+
+"""
+@file 		benchmark.py
+
+Times every stage of the analysis on synthetic exports of growing size.
+
+The exports are generated by _synthetic_export (the same options always give
+the same file) into the work directory and reused by later runs. Every size is
+analyzed as chat 1 of its export, the stages are timed one by one and the
+results of all sizes are written to one json file:
+
+    {"python": "3.11.4", "platform": "...", "date": "2026-10-18T12:00:00",
+     "export": {options of the generator},
+     "runs": [{"messages": 10000, "file_size": 2510043,
+               "stages": [{"stage": "load", "wall": 0.21, "cpu": 0.2, ...},
+                          ...
+                          {"stage": "plot_month", "wall": 0.18, ...}]}]}
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import optparse
+import platform
+from datetime import datetime
+
+import _synthetic_export
+from _stage_timer import stage
+
+parser = optparse.OptionParser("benchmark.py [options]")
+parser.add_option(
+    "-s",
+    "--sizes",
+    dest="sizes",
+    type="string",
+    default="10000,1000000,10000000",
+    help="message counts to benchmark, separated by ',' [default: %default]",
+)
+parser.add_option(
+    "-o",
+    "--output",
+    dest="output",
+    type="string",
+    default="benchmark.json",
+    help="json file for the results [default: %default]",
+)
+parser.add_option(
+    "--work-dir",
+    dest="work_dir",
+    type="string",
+    default="__benchmark__",
+    help="directory for the generated exports [default: %default]",
+)
+parser.add_option(
+    "--senders",
+    dest="senders",
+    type="int",
+    default=_synthetic_export.DEFAULTS["senders"],
+    help="senders per chat, 2 for a personal chat [default: %default]",
+)
+parser.add_option(
+    "--words",
+    dest="words",
+    type="float",
+    default=_synthetic_export.DEFAULTS["words"],
+    help="mean number of words per text [default: %default]",
+)
+parser.add_option(
+    "--emoji-density",
+    dest="emoji_density",
+    type="float",
+    default=_synthetic_export.DEFAULTS["emoji_density"],
+    help="chance of a word to be an emoji [default: %default]",
+)
+parser.add_option(
+    "--list-text",
+    dest="list_text",
+    type="float",
+    default=_synthetic_export.DEFAULTS["list_text"],
+    help="share of texts written as a list of entities [default: %default]",
+)
+parser.add_option(
+    "--photo",
+    dest="photo",
+    type="float",
+    default=_synthetic_export.DEFAULTS["photo"],
+    help="share of photos [default: %default]",
+)
+parser.add_option(
+    "--media",
+    dest="media",
+    type="float",
+    default=_synthetic_export.DEFAULTS["media"],
+    help="share of stickers, voice and video messages [default: %default]",
+)
+parser.add_option(
+    "--call",
+    dest="call",
+    type="float",
+    default=_synthetic_export.DEFAULTS["call"],
+    help="share of phone calls [default: %default]",
+)
+parser.add_option(
+    "--seed",
+    dest="seed",
+    type="int",
+    default=_synthetic_export.DEFAULTS["seed"],
+    help="seed of the generator [default: %default]",
+)
+parser.add_option(
+    "-w",
+    "--words-list",
+    dest="wordlist",
+    type="string",
+    default="pizza;vacation",
+    help="words to count, separated by ';' [default: %default]",
+)
+parser.add_option(
+    "--no-plots",
+    dest="plots",
+    action="store_false",
+    default=True,
+    help="do not time the html plots",
+)
+(opts, args) = parser.parse_args()
+
+LIMIT = 5
+
+
+def export_options(messages):
+    options = {"messages": messages}
+    for key in ("senders", "words", "emoji_density", "list_text", "photo", "media", "call", "seed"):
+        options[key] = getattr(opts, key)
+    return options
+
+
+# the file name depends on all options, so a changed option generates a new export
+def export_path(options):
+    digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:10]
+    return os.path.join(opts.work_dir, "export_" + str(options["messages"]) + "_" + digest + ".json")
+
+
+"""
+@input  messages (int)   size of the chat
+@input  wordlist (list)  words to count
+@output run      (dict)  size of the export and the records of all stages
+"""
+
+
+def benchmark(messages, wordlist):
+    from _export_reader import iter_chats
+    from _message_table import build_table
+    from _message_aggregate import aggregate
+    from _message_numerics import _message_numerics
+    from _raw_output import write_raw
+    from _series_table import write_series
+
+    options = export_options(messages)
+    path = export_path(options)
+    run = {"messages": messages, "stages": []}
+    stages = run["stages"]
+    if not os.path.exists(path):
+        print("generating " + path + "...")
+        # not one of the stages, it only happens on the first run of a size
+        generated = []
+        with stage(generated, "generate", messages):
+            _synthetic_export.write_export(path + ".part", options)
+        os.replace(path + ".part", path)
+        run["generate"] = generated[0]
+    run["file_size"] = os.path.getsize(path)
+
+    conv_path = "benchmark_" + str(messages)
+    directory = "__generated__/" + conv_path
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    print("timing " + str(messages) + " messages...")
+    with stage(stages, "load", messages):
+        select = lambda chat: chat.get("id") == 1
+        for chat in iter_chats(path, select):
+            if "messages" in chat:
+                table = build_table(chat["messages"])
+                break
+    with stage(stages, "aggregate", messages):
+        aggregated = aggregate(table, "1970-01-01", wordlist)
+    with stage(stages, "numerics", messages):
+        metrics = _message_numerics(aggregated, LIMIT)
+    with stage(stages, "raw_ndjson", messages):
+        write_raw(directory + "/raw_metrics.ndjson.gz", metrics, aggregated)
+    with stage(stages, "raw_json", messages):
+        with open(directory + "/raw_metrics.json", "w", encoding="utf-8") as fh:
+            json.dump(metrics, fh, indent=4, sort_keys=True)
+    with stage(stages, "series_csv", messages):
+        write_series(directory, aggregated)
+    if opts.plots:
+        import _message_graphs
+
+        # the frames all plots share, then every histogram_* renderer on its own
+        with stage(stages, "plot_frames", messages):
+            frames = _message_graphs._build_frames(aggregated)
+        for plot in _message_graphs._plots(wordlist):
+            with stage(stages, plot[0][: -len(".html")], messages):
+                _message_graphs._render(conv_path, frames, plot, False, "cdn")
+    for record in stages:
+        print("  " + record["stage"].ljust(32) + "\t" + str(record["wall"]) + " s")
+    return run
+
+
+def main():
+    try:
+        sizes = [int(size) for size in opts.sizes.split(",")]
+    except ValueError:
+        print("Error: --sizes must be a list of numbers separated by ','")
+        exit(-1)
+    wordlist = opts.wordlist.lower().split(";")
+    if not os.path.exists(opts.work_dir):
+        os.makedirs(opts.work_dir)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "date": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        "export": export_options(None),
+        "runs": [],
+    }
+    del results["export"]["messages"]
+    for messages in sizes:
+        results["runs"].append(benchmark(messages, wordlist))
+        # written after every size, a long run can be stopped at any time
+        with open(opts.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=4)
+    print("results written to " + opts.output)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt as e:
+        print("Aborted by KeyboardInterrupt")
+        exit(0)
@@ -1,93 +1,75 @@
-#! /usr/bin/python3
-
-# _*_ coding: utf-8 _*_
-
-from __future__ import print_function
-
-import optparse
-import json
-import os
-from datetime import datetime
-
-parser = optparse.OptionParser("convert-human.py")
-parser.add_option(
-    "-i", "--input-file", dest="indir", type="string", help="chat history file"
-)
-(opts, args) = parser.parse_args()
-
-# Writes a dict in json format to a file
-def dump_to_json_file(filename, data):
-    with open(filename, "w", encoding="utf-8") as fh:
-        json.dump(data, fh, indent=1, sort_keys=True)
-
-
-def load_file_to_srting(filename):
-    with open(filename, "r") as fh:
-        data = fh.read()
-    return data
-
-
-def split_string_to_messages(string):
-    global dateseprarator
-    messages=[]
-    for line in string.split("\n["):
-        messages.append(line)
-    return messages
-
-
-def to_telegram_format(messages):
-    data = {}
-    data["chats"] = {}
-    data["chats"]["about"] = "This page lists all chats from this export."
-    data["chats"]["list"] = []
-    data["chats"]["list"].append({})
-    data["chats"]["list"][0]["name"] = "unknown"
-    data["chats"]["list"][0]["type"] = "personal_chat"
-    data["chats"]["list"][0]["id"] = 1
-    data["chats"]["list"][0]["messages"] = []
-
-    id = 0
-    for message in messages:
-        msg_split = message.split("]", 2)
-        if len(msg_split) != 3:
-            continue
-        date_time = msg_split[0].replace('[','').strip()
-        name = msg_split[1].replace('[', '').strip()
-        text = msg_split[2][2:]
-        data["chats"]["list"][0]["messages"].append({})
-        data["chats"]["list"][0]["messages"][-1]["id"] = id
-        data["chats"]["list"][0]["messages"][-1]["type"] = "message"
-        # if we find "T", assume "%Y-%m-%dTH:%M:%S.%f", otherwise "%Y-%m-%d %H:%M:%S"
-        date_format = "%Y-%m-%dT%H:%M:%S"
-        if not "T" in date_time:
-            date_format = "%Y-%m-%d %H:%M:%S.%f" if '.' in date_time else "%Y-%m-%d %H:%M:%S"
-        data["chats"]["list"][0]["messages"][-1]["date"] = datetime.strptime(date_time, date_format).strftime("%Y-%m-%dT%H:%M:%S")
-        data["chats"]["list"][0]["messages"][-1]["edited"] = "1970-01-01T01:00:00"
-        data["chats"]["list"][0]["messages"][-1]["from"] = name
-        data["chats"]["list"][0]["messages"][-1]["text"] = text
-        id += 1
-    return data
-
-
-### MAIN
-def main():
-    if opts.indir is None:
-        parser.print_help()
-        exit(0)
-    raw = load_file_to_srting(opts.indir)
-    messages = split_string_to_messages(raw)
-    formatted = to_telegram_format(messages)
-
-    # Create dir
-    if not os.path.exists("__import__"):
-        os.makedirs("__import__")
-
-    dump_to_json_file("__import__/human-results.json", formatted)
-
-
-if __name__ == "__main__":
-    try:
-        main()
-    except KeyboardInterrupt as e:
-        print("Aborted by KeyboardInterrupt")
-        exit(0)
+#! /usr/bin/python3
+
+# _*_ coding: utf-8 _*_
+
+from __future__ import print_function
+
+import sys
+import optparse
+import os
+
+from _human_reader import CHAT, iter_messages
+from _export_writer import write_export, write_ndjson
+
+parser = optparse.OptionParser("convert-human.py")
+parser.add_option(
+    "-i", "--input-file", dest="indir", type="string", help="chat history file, - for stdin"
+)
+parser.add_option(
+    "-o",
+    "--output-file",
+    dest="output",
+    type="string",
+    help="converted file, - for stdout [default: __import__/human-results.json or .ndjson]",
+)
+parser.add_option(
+    "--ndjson",
+    dest="ndjson",
+    action="store_true",
+    default=False,
+    help="write one json message per line instead of a Telegram style export",
+)
+(opts, args) = parser.parse_args()
+
+
+### MAIN
+def main():
+    if opts.indir is None:
+        parser.print_help()
+        exit(0)
+
+    output = opts.output
+    if output is None:
+        # Create dir
+        if not os.path.exists("__import__"):
+            os.makedirs("__import__")
+        output = "__import__/human-results." + ("ndjson" if opts.ndjson else "json")
+
+    # - reads the log from stdin, so the converter can sit in a pipeline
+    try:
+        fh = open(0 if opts.indir == "-" else opts.indir, "r", encoding="utf-8")
+    except IOError:
+        print("Error: could not open " + opts.indir)
+        exit(-1)
+    counts = {}
+    with fh:
+        if opts.ndjson:
+            count = write_ndjson(output, iter_messages(fh, counts))
+        else:
+            count = write_export(output, CHAT, iter_messages(fh, counts))
+    # the messages go to stdout with -o -, the report to stderr
+    report = sys.stderr if output == "-" else sys.stdout
+    if counts["skipped"] > 0:
+        print(
+            "Warning: skipped " + str(counts["skipped"]) + " messages with an unknown date format",
+            file=report,
+        )
+    print(str(count) + " messages written to " + output, file=report)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt as e:
+        print("Aborted by KeyboardInterrupt")
+        exit(0)
@@ -22,30 +22,49 @@ import optparse
 import re
 import json
 import codecs
-import numpy as np  # install with pip3
-import pandas as pd  # install with pip3
-import bokeh  # install with pip3
+import hashlib
+import pickle
 from pprint import pprint
+from contextlib import nullcontext
 from collections import Counter
 from datetime import datetime
 from datetime import timedelta
 
-from _message_numerics import _message_numerics
-from _message_graphs import _message_graphs
+from _export_reader import export_kind, iter_chats
+from _input_adapters import detect_format, load_chat
+from _series_table import write_series
+from _stage_timer import stage, write_profile
+
+# numpy (install with pip3), pandas and bokeh (only for the plots) are imported
+# by the stages that need them, listing the chats of an export loads none of them
 
 parser = optparse.OptionParser("telegram-stats")
 parser.add_option(
     "-i", "--input-file", dest="indir", type="string", help="chat history file"
 )
+parser.add_option(
+    "--format",
+    dest="format",
+    type="choice",
+    choices=["telegram", "whatsapp", "human"],
+    help="format of the chat history (telegram|whatsapp|human) [default: detected]",
+)
 parser.add_option("-n", "--name", dest="name", type="string", help="name of the person")
 parser.add_option("-c", "--id", dest="id", type="string", help="chat id of the person")
 parser.add_option(
     "-d",
+    "--date-from",
     "--date-max",
     dest="date",
     type="string",
     help="only count messages after date [YYYY-MM-DD]",
 )
+parser.add_option(
+    "--date-until",
+    dest="date_until",
+    type="string",
+    help="only count messages up to date (inclusive) [YYYY-MM-DD]",
+)
 parser.add_option(
     "-w",
     "--word-list",
@@ -53,8 +72,132 @@ parser.add_option(
     type="string",
     help='count occurrences of words -w "John;Vacation"',
 )
+parser.add_option(
+    "--full-wordlists",
+    dest="full_wordlists",
+    action="store_true",
+    default=False,
+    help="write the complete sorted word and emoji lists to the raw metrics",
+)
+parser.add_option(
+    "--raw-json",
+    dest="raw_json",
+    action="store_true",
+    default=False,
+    help="write the raw metrics as indented raw_metrics.json instead of raw_metrics.ndjson.gz",
+)
+parser.add_option(
+    "--all",
+    dest="all",
+    action="store_true",
+    default=False,
+    help="analyze every chat of a full export",
+)
+parser.add_option(
+    "--chats",
+    dest="chats",
+    type="string",
+    help='analyze every chat whose name matches a regex --chats "^(John|Jane)"',
+)
+parser.add_option(
+    "-j",
+    "--jobs",
+    dest="jobs",
+    type="int",
+    help="number of worker processes, chats for --all / --chats or shards of a single large chat (default: cpu count)",
+)
+parser.add_option(
+    "--list",
+    dest="list",
+    action="store_true",
+    default=False,
+    help="list the chats of the export with their message count and first/last date",
+)
+parser.add_option(
+    "--no-plots",
+    dest="plots",
+    action="store_false",
+    default=True,
+    help="only write the text results and the raw data, without loading bokeh and pandas",
+)
+parser.add_option(
+    "--no-show",
+    dest="show",
+    action="store_false",
+    default=True,
+    help="only save the plots, never open them in the browser (for headless and scheduled runs)",
+)
+parser.add_option(
+    "--dashboard",
+    dest="dashboard",
+    action="store_true",
+    default=False,
+    help="write all plots as tabs of a single dashboard.html",
+)
+parser.add_option(
+    "--resources",
+    dest="resources",
+    type="choice",
+    choices=["cdn", "inline"],
+    default="cdn",
+    help="load BokehJS from the cdn or embed it in the html files (cdn|inline) [default: %default]",
+)
+parser.add_option(
+    "--incremental",
+    dest="incremental",
+    action="store_true",
+    default=False,
+    help="keep the aggregates of this run and only add the new messages on the next run",
+)
+parser.add_option(
+    "--cache-dir",
+    dest="cache_dir",
+    type="string",
+    default="__generated__/.cache",
+    help="directory of the parsed chat cache [default: %default]",
+)
+parser.add_option(
+    "--cache-size",
+    dest="cache_size",
+    type="int",
+    default=2048,
+    help="size cap of the cache in MB [default: %default]",
+)
+parser.add_option(
+    "--no-cache",
+    dest="cache",
+    action="store_false",
+    default=True,
+    help="always parse the export, do not read or write the cache",
+)
+parser.add_option(
+    "--profile",
+    dest="profile",
+    action="store_true",
+    default=False,
+    help="write wall and CPU time, messages/sec and memory of every stage to profile.json",
+)
+parser.add_option(
+    "--profile-memory",
+    dest="profile_memory",
+    action="store_true",
+    default=False,
+    help="--profile with the peak Python memory of every stage (tracemalloc, slows the run down)",
+)
+parser.add_option(
+    "--profile-stats",
+    dest="profile_stats",
+    action="store_true",
+    default=False,
+    help="--profile with a cProfile dump profile_<stage>.prof of every stage",
+)
 (opts, args) = parser.parse_args()
 
+# number of entries in the word and emoji lists
+LIMIT = 5
+# version of the aggregate state written by --incremental
+STATE_VERSION = 3
+
 # Writes a dict in json format to a file
 def dump_to_json_file(conv_path, filename, data):
     with open("__generated__/" + conv_path + "/" + filename, "w", encoding="utf-8") as fh:
@@ -69,51 +212,179 @@ def dump_to_unicode_file(conv_path, filename, data):
     fh.close()
 
 
-# writes a dict to a csv format
-def dump_dict_to_csv_file(conv_path, filename, dict):
-    (
-        pd.DataFrame.from_dict(data=dict, orient="index").to_csv(
-            "__generated__/" + conv_path + "/" + filename, header=False, sep=";"
-        )
-    )
+"""
+@input  path   (str)
+@input  format (str)  --format, None to detect it
+@output format (str)  one of _input_adapters.FORMATS
+@output kind   (str)  "full" for a full Telegram export, "single" for one chat
+"""
 
 
-def load_file_to_raw(path):
+def check_input_file(path, format=None):
     try:
-        with open(path, encoding="utf-8-sig") as fh:
-            data = json.load(fh)
-        return data
+        if format is None:
+            format = detect_format(path)
+        if format is None:
+            print("Error: unknown file format, choose one with --format")
+            exit(-1)
+        if format != "telegram":
+            return format, "single"
+        return format, export_kind(path)
     except IOError:
         print("Error: could not open the file")
         exit(-1)
+    except ValueError as e:
+        print("Error: " + str(e))
+        exit(-1)
 
 
-def select_chat_from_name(data, name):
-    try:
-        for chat in data["chats"]["list"]:
-            if "name" in chat:
-                if name == chat["name"]:
-                    return chat
-        print("Error: invalid chat name: " + name)
-        exit(-1)
-    except KeyError:
-        print("Error: wrong file format (name not found)")
+# only the messages of the matching chat are decoded, all others are skipped
+def select_chat_from_name(path, name):
+    for chat in iter_chats(path, lambda chat: chat.get("name") == name):
+        if "messages" in chat:
+            return chat
+    print("Error: invalid chat name: " + name)
+    exit(-1)
 
 
-def select_chat_from_id(data, id):
+def select_chat_from_id(path, id):
     id = str(id)
+    for chat in iter_chats(path, lambda chat: str(chat.get("id")) == id):
+        if "messages" in chat:
+            return chat
+    print("Error: invalid chat id: " + id)
+    exit(-1)
+
+
+def cache_key(path):
+    if not opts.cache:
+        return None
+    import _export_cache
+
+    return _export_cache.fingerprint(path)
+
+
+# a cache that can not be written only costs the time to parse the export again
+def store_in_cache(key, chat_data, table):
+    if key is None:
+        return
+    import _export_cache
+
+    try:
+        _export_cache.store_chat(
+            opts.cache_dir, key, opts.indir, chat_data, table, opts.cache_size << 20
+        )
+    except OSError as e:
+        print("Warning: could not write the cache: " + str(e))
+
+
+# the stages of --profile, None without it
+def new_profile():
+    if not (opts.profile or opts.profile_memory or opts.profile_stats):
+        return None
+    profile = {}
+    profile["stages"] = []
+    profile["profilers"] = {} if opts.profile_stats else None
+    return profile
+
+
+def timed(profile, name, messages=None):
+    if profile is None:
+        return nullcontext({})
+    return stage(profile["stages"], name, messages, profile["profilers"])
+
+
+def load_state(conv_path):
     try:
-        for chat in data["chats"]["list"]:
-            if "id" in chat:
-                if id == str(chat["id"]):
-                    return chat
-    except KeyError:
-        print("Error: wrong file format (keys not found)")
+        with open("__generated__/" + conv_path + "/aggregate_state.pickle", "rb") as fh:
+            state = pickle.load(fh)
+    except (IOError, EOFError, pickle.UnpicklingError):
+        return None
+    if state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+# hash of the first rows of a table, the id of the last row is not enough:
+# WhatsApp and text logs number their messages by position, so a re-export
+# that lost old messages can still end on the same id
+def prefix_signature(table, rows):
+    digest = hashlib.sha1()
+    for name in ("id", "unixtime", "sender", "author", "chars"):
+        digest.update(table[name][:rows])
+    # the sender codes are given in the order of the first message of each name
+    codes = max(int(table["sender"][:rows].max()), int(table["author"][:rows].max())) + 1
+    digest.update(json.dumps(table["senders"][:codes]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def save_state(conv_path, state):
+    path = "__generated__/" + conv_path + "/aggregate_state.pickle"
+    with open(path + ".tmp", "wb") as fh:
+        pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+"""
+@input  conv_path   (str)
+@input  table       (dict)  chat table of the current export
+@output aggregated  (dict)  output of _message_aggregate.aggregate
+
+The aggregates of the last --incremental run are kept in aggregate_state.pickle
+together with the number of rows and a signature of these rows (ids, dates,
+senders and lengths). A newer export of the same chat starts with the same
+messages, so only the rows after them are aggregated and merged into the
+stored state. Everything is computed again if the options changed or the export does not continue the
+stored one (deleted messages, another chat with the same name).
+"""
+
+
+def update_aggregate(
+    conv_path, table, date_filter, wordlist, log, jobs=1, date_until=None
+):
+    from _message_aggregate import aggregate, merge
+
+    options = {}
+    options["date_filter"] = date_filter
+    options["date_until"] = date_until
+    options["wordlist"] = list(wordlist)
+    ids = table["id"]
+    state = load_state(conv_path)
+    first = 0
+    if state is not None and state["options"] == options:
+        rows = state["rows"]
+        if 0 < rows <= len(ids) and prefix_signature(table, rows) == state["signature"]:
+            first = rows
+
+    aggregated = None
+    if first == len(ids):
+        log("no new messages since the last run")
+        aggregated = state["metrics"]
+    elif first > 0:
+        log("adding " + str(len(ids) - first) + " new messages...")
+        newer = aggregate(
+            table, date_filter, wordlist, first, jobs=jobs, date_until=date_until
+        )
+        if newer["A"]["name"] == state["metrics"]["A"]["name"]:
+            aggregated = merge(state["metrics"], newer)
+    if aggregated is None:
+        aggregated = aggregate(
+            table, date_filter, wordlist, jobs=jobs, date_until=date_until
+        )
+
+    state = {}
+    state["version"] = STATE_VERSION
+    state["options"] = options
+    state["rows"] = len(ids)
+    state["signature"] = prefix_signature(table, len(ids)) if len(ids) > 0 else None
+    state["metrics"] = aggregated
+    save_state(conv_path, state)
+    return aggregated
 
 
 def dump_text_results(conv_path, metrics):
     result = ""
-    result += "\n" + ("[name: " + metrics["A"]["name"] + "]")
+    result += "\n" + ("[name: " + str(metrics["A"]["name"]) + "]")
     result += "\n" + ("total message count:     \t" + str(metrics["A"]["total_messages"]))
     result += "\n" + ("total word count:        \t" + str(metrics["A"]["total_words"]))
     result += "\n" + ("total character count:   \t" + str(metrics["A"]["total_chars"]))
@@ -128,9 +399,14 @@ def dump_text_results(conv_path, metrics):
         result += "\n" + ("total photos:            \t" + str(metrics["A"]["photo"]))
     for key in metrics["A"]["media"]:
         result += "\n" + ("total " + str(key) + " count: \t\t" + str(metrics["A"]["media"][key]))
+    for key in metrics["A"]["word_occurrences"]:
+        result += "\n" + ("occurrences of " + key + ": \t\t" + str(metrics["A"]["word_occurrences"][key]))
+    for key, value in metrics["A"]["reply_time_percentiles"].items():
+        if value is not None:
+            result += "\n" + ((key + " reply time:").ljust(25) + "\t" + str(round(value)) + " s")
 
     result += "\n" + ("")
-    result += "\n" + ("[name: " + metrics["B"]["name"] + "]")
+    result += "\n" + ("[name: " + str(metrics["B"]["name"]) + "]")
     result += "\n" + ("total message count:     \t" + str(metrics["B"]["total_messages"]))
     result += "\n" + ("total word count:        \t" + str(metrics["B"]["total_words"]))
     result += "\n" + ("total character count:   \t" + str(metrics["B"]["total_chars"]))
@@ -144,6 +420,11 @@ def dump_text_results(conv_path, metrics):
         result += "\n" + ("total photos:            \t" + str(metrics["B"]["photo"]))
     for key in metrics["B"]["media"]:
         result += "\n" + ("total " + str(key) + " count: \t\t" + str(metrics["B"]["media"][key]))
+    for key in metrics["B"]["word_occurrences"]:
+        result += "\n" + ("occurrences of " + key + ": \t\t" + str(metrics["B"]["word_occurrences"][key]))
+    for key, value in metrics["B"]["reply_time_percentiles"].items():
+        if value is not None:
+            result += "\n" + ((key + " reply time:").ljust(25) + "\t" + str(round(value)) + " s")
 
     result += "\n" + ("")
     result += "\n" + ("[ combined stats ]")
@@ -152,54 +433,55 @@ def dump_text_results(conv_path, metrics):
     dump_to_unicode_file(conv_path, "text_results.txt", result)
 
 
-def calculate_metrics(conv_path, chat_data, date_filter):
-    metrics = _message_numerics(chat_data, date_filter)
-    dump_to_json_file(conv_path, "raw_metrics.json", metrics)
+def calculate_metrics(conv_path, aggregated):
+    from _message_numerics import _message_numerics
+
+    metrics = _message_numerics(aggregated, LIMIT, opts.full_wordlists)
+    if opts.raw_json:
+        dump_to_json_file(conv_path, "raw_metrics.json", metrics)
+    else:
+        from _raw_output import write_raw
+
+        write_raw(
+            "__generated__/" + conv_path + "/raw_metrics.ndjson.gz", metrics, aggregated
+        )
 
-    LIMIT = 5
-    
     # Emojis
-    ustr = "" + metrics["A"]["name"] + "\n"
+    ustr = "" + str(metrics["A"]["name"]) + "\n"
     for e in metrics["A"]["emojilist"][:LIMIT]:
         ustr += str(e[0]) + " : " + str(e[1]) + "\n"
-    ustr += metrics["B"]["name"] + "\n"
+    ustr += str(metrics["B"]["name"]) + "\n"
     for e in metrics["B"]["emojilist"][:LIMIT]:
         ustr += str(e[0]) + " : " + str(e[1]) + "\n"
     dump_to_unicode_file(conv_path, "emojis.txt", ustr)
 
     # Wordlists
-    ustr = "" + metrics["A"]["name"] + "\n"
+    ustr = "" + str(metrics["A"]["name"]) + "\n"
     for e in metrics["A"]["wordlist"][:LIMIT]:
         ustr += str(e[0]) + " : " + str(e[1]) + "\n"
-    ustr += metrics["B"]["name"] + "\n"
+    ustr += str(metrics["B"]["name"]) + "\n"
     for e in metrics["B"]["wordlist"][:LIMIT]:
         ustr += str(e[0]) + " : " + str(e[1]) + "\n"
     dump_to_unicode_file(conv_path, "wordlist.txt", ustr)
 
     # Big wordlists
-    ustr = "" + metrics["A"]["name"] + "\n"
-    count = 0
-    for e in metrics["A"]["wordlist"]:
-        if len(e[1]) >= 5:
-            ustr += str(e[0]) + " : " + str(e[1]) + "\n"
-            count += 1
-        if count >= LIMIT:
-            break
-    ustr += metrics["B"]["name"] + "\n"
-    count = 0
-    for e in metrics["B"]["wordlist"]:
-        if len(e[1]) >= 5:
-            ustr += str(e[0]) + " : " + str(e[1]) + "\n"
-            count += 1
-        if count >= LIMIT:
-            break
+    ustr = "" + str(metrics["A"]["name"]) + "\n"
+    for e in metrics["A"]["bigwordlist"]:
+        ustr += str(e[0]) + " : " + str(e[1]) + "\n"
+    ustr += str(metrics["B"]["name"]) + "\n"
+    for e in metrics["B"]["bigwordlist"]:
+        ustr += str(e[0]) + " : " + str(e[1]) + "\n"
     dump_to_unicode_file(conv_path, "bigwordlist.txt", ustr)
 
     return metrics
 
 
-def calculate_graphs(conv_path, chat_data, date_filter, wordlist):
-    return _message_graphs(conv_path, chat_data, date_filter, wordlist)
+def calculate_graphs(conv_path, aggregated, wordlist, show=True, jobs=1):
+    from _message_graphs import _message_graphs
+
+    return _message_graphs(
+        conv_path, aggregated, wordlist, show, opts.dashboard, opts.resources, jobs
+    )
 
 
 # https://stackoverflow.com/questions/16870663/how-do-i-validate-a-date-string-format-in-python
@@ -211,10 +493,10 @@ def validate_date(date_text):
         exit(-1)
 
 
-def print_available_names(raw_data):
+def print_available_names(path):
     print("")
     print("available chat names:")
-    for chat in raw_data["chats"]["list"]:
+    for chat in iter_chats(path):
         if "name" in chat:
             name = chat["name"]
             if name is not None:
@@ -227,6 +509,237 @@ def print_available_names(raw_data):
             print(name + " \t" + str(chat["id"]) + " \t(" + chat["type"] + ")")
 
 
+# message count, first and last date of a chat, only the dates are kept
+def _chat_summary(chat):
+    count = 0
+    first = ""
+    last = ""
+    for message in chat["messages"]:
+        count += 1
+        if "date" in message:
+            if not first:
+                first = message["date"]
+            last = message["date"]
+    return [str(chat.get("name")), str(chat.get("id")), str(chat.get("type")), str(count), first, last]
+
+
+"""
+@input  path   (str)
+@input  kind   (str)  "full" or "single"
+@input  format (str)  one of _input_adapters.FORMATS
+
+prints one tab separated line per chat, streamed while the export is read
+"""
+
+
+def list_chats(path, kind, format):
+    print("name\tid\ttype\tmessages\tfirst\tlast")
+    if kind == "full":
+        chats = iter_chats(path, lambda chat: True, ("date",))
+    else:
+        chats = [load_chat(path, format, ("date",))]
+    for chat in chats:
+        if "messages" not in chat:
+            chat["messages"] = []
+        print("\t".join(_chat_summary(chat)), flush=True)
+
+
+"""
+@input  chat_data   (dict)  chat header (name, id, type)
+@input  table       (dict)  chat table of _message_table.build_table
+@input  show        (bool)  open the plots in the browser
+@input  log         (function)
+@input  incremental (bool)  reuse the aggregates of the last run
+@input  jobs        (int)   worker processes for the shards of a large chat and the plots
+@input  date_until  (str)   last day to count [YYYY-MM-DD], None for no limit
+@input  profile     (dict)  stages of --profile timed so far, see new_profile()
+@output conv_path   (str)   directory in __generated__ with the results
+
+computes and writes all the results of one chat
+"""
+
+
+def analyze_chat(
+    chat_data,
+    table,
+    date_filter,
+    wordlist,
+    show=True,
+    log=print,
+    incremental=False,
+    jobs=1,
+    date_until=None,
+    profile=None,
+):
+    conv_path = str(chat_data["name"]).replace("/", "_") + "_" + str(chat_data["id"])
+
+    # Create directory
+    if not os.path.exists("__generated__/" + conv_path):
+        os.makedirs("__generated__/" + conv_path)
+
+    from _message_aggregate import aggregate
+
+    if profile is None:
+        profile = new_profile()
+    messages = len(table["type"])
+
+    with timed(profile, "aggregate", messages):
+        if incremental:
+            aggregated = update_aggregate(
+                conv_path, table, date_filter, wordlist, log, jobs, date_until
+            )
+        else:
+            aggregated = aggregate(
+                table, date_filter, wordlist, jobs=jobs, date_until=date_until
+            )
+
+    log("calculating metrics...")
+    with timed(profile, "metrics", messages):
+        metrics = calculate_metrics(conv_path, aggregated)
+
+    if opts.plots:
+        log("generating graphs...")
+        with timed(profile, "graphs", messages):
+            calculate_graphs(conv_path, aggregated, wordlist, show, jobs)
+
+    # all monthly, weekday and hour series of both persons in one table
+    with timed(profile, "series", messages):
+        write_series("__generated__/" + conv_path, aggregated)
+
+    with timed(profile, "text", messages):
+        dump_text_results(conv_path, metrics)
+
+    if profile is not None:
+        write_profile("__generated__/" + conv_path, profile["stages"], profile["profilers"])
+        log("profile written to __generated__/" + conv_path + "/profile.json")
+    return conv_path
+
+
+def _silent(message):
+    pass
+
+
+"""
+@input  path   (str)       full export
+@input  select (function)  chooses the chats by their header
+@input  key    (str)       cache key of the export, None without the cache
+@output tables (generator) (chat header, table) of every selected chat, once each
+
+The tables come from the cache if the whole export is cached, otherwise the
+export is parsed and only the selected chats are decoded and cached. The
+cache is marked complete only when every chat of the export was read.
+"""
+
+
+def _tables(path, select, key):
+    import _export_cache
+    from _message_table import build_table
+
+    # ids of the chats already yielded from the cache
+    done = set()
+    if key is not None:
+        chats = _export_cache.cached_chats(opts.cache_dir, key)
+        if chats is not None:
+            print("using the cached chats")
+            for chat in chats:
+                if select(chat):
+                    table = _export_cache.load_table(opts.cache_dir, key, chat["id"])
+                    if table is None:
+                        # the entry is gone, parse the export for the others
+                        chats = None
+                        break
+                    done.add(chat["id"])
+                    yield dict(chat), table
+            if chats is not None:
+                return
+
+    state = {"complete": True}
+
+    def wanted(chat):
+        if not select(chat):
+            state["complete"] = False
+            return False
+        return chat.get("id") not in done
+
+    for chat in iter_chats(path, wanted):
+        if "messages" not in chat:
+            continue
+        table = build_table(chat["messages"])
+        del chat["messages"]
+        store_in_cache(key, chat, table)
+        yield chat, table
+    if key is not None and state["complete"]:
+        _export_cache.mark_complete(opts.cache_dir, key)
+
+
+"""
+@input  path       (str)   full export
+@input  pattern    (str)   regex for the chat names, "" for all chats
+@input  jobs       (int)   number of worker processes
+@input  key        (str)   cache key of the export, None without the cache
+@input  date_until (str)   last day to count [YYYY-MM-DD], None for no limit
+@output failed     (int)   number of chats that could not be analyzed
+
+The export is read once, every matching chat is turned into its table here
+and analyzed in a worker process. Only a few tables wait for a free worker
+at any time, so memory does not grow with the number of chats.
+"""
+
+
+def analyze_chats(path, pattern, date_filter, wordlist, jobs, key, date_until=None):
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+    regex = re.compile(pattern)
+    select = lambda chat: regex.search(str(chat.get("name"))) is not None
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = {}
+
+        def collect(futures):
+            nonlocal failed
+            for future in futures:
+                chat = pending.pop(future)
+                try:
+                    print("done: " + future.result())
+                except Exception as e:
+                    failed += 1
+                    print(
+                        "Error: could not analyze chat "
+                        + str(chat.get("name"))
+                        + " ("
+                        + str(chat.get("id"))
+                        + "): "
+                        + repr(e)
+                    )
+
+        for chat, table in _tables(path, select, key):
+            if len(table["type"]) == 0:
+                print("skipped: " + str(chat.get("name")) + " (no messages)")
+                continue
+            # saved messages, channels and one-sided chats have no second person
+            if len(set(table["sender"][table["sender"] >= 0].tolist())) < 2:
+                print("skipped: " + str(chat.get("name")) + " (less than two senders)")
+                continue
+            future = pool.submit(
+                analyze_chat,
+                chat,
+                table,
+                date_filter,
+                wordlist,
+                False,
+                _silent,
+                opts.incremental,
+                1,
+                date_until,
+            )
+            pending[future] = chat
+            if len(pending) >= 2 * jobs:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(list(pending))
+    return failed
+
+
 ### MAIN
 def main():
     if opts.indir is None:
@@ -237,95 +750,98 @@ def main():
     if opts.date is not None:
         validate_date(opts.date)
         date_filter = opts.date
+    date_until = None
+    if opts.date_until is not None:
+        validate_date(opts.date_until)
+        date_until = opts.date_until
 
-    print("importing raw data...")
-    raw_data = load_file_to_raw(opts.indir)
+    wordlist = ""
+    if opts.words is not None:
+        wordlist = opts.words.lower().split(";")
+
+    format, kind = check_input_file(opts.indir, opts.format)
+    if opts.list:
+        list_chats(opts.indir, kind, format)
+        exit(0)
+
+    if opts.profile_memory:
+        import tracemalloc
+
+        tracemalloc.start()
 
-    if "chats" in raw_data:
+    print("importing raw data...")
+    if kind == "full":
         print("input data is full chat export")
+        if opts.all or opts.chats is not None:
+            pattern = opts.chats if opts.chats is not None else ""
+            jobs = opts.jobs or os.cpu_count() or 1
+            failed = analyze_chats(
+                opts.indir,
+                pattern,
+                date_filter,
+                wordlist,
+                jobs,
+                cache_key(opts.indir),
+                date_until,
+            )
+            print("done")
+            exit(-1 if failed else 0)
         if opts.id is None and opts.name is None:
             print("Error: argument <name> not specified.")
             print("I do now know which chat to analyze.")
             print("Available chats are:")
-            print_available_names(raw_data)
+            print_available_names(opts.indir)
             exit(0)
         if opts.id is not None:
-            chat_data = select_chat_from_id(raw_data, opts.id)
-        elif opts.name is not None:
-            chat_data = select_chat_from_name(raw_data, opts.name)
-    else:
+            select = lambda chat: str(chat.get("id")) == str(opts.id)
+        else:
+            select = lambda chat: chat.get("name") == opts.name
+    elif format == "telegram":
         print("input data is a single chat export")
-        chat_data = raw_data
-
-    conv_path = chat_data["name"] + "_" + str(chat_data["id"])
-    
-    # Create directory
-    if not os.path.exists("__generated__/" + conv_path):
-        os.makedirs("__generated__/" + conv_path)
-
-    wordlist = ""
-    if opts.words is not None:
-        wordlist = opts.words.lower().split(";")
-
-    print("calculating metrics...")
-    metrics = calculate_metrics(conv_path, chat_data, date_filter)
-
-    print("generating graphs...")
-    raw = calculate_graphs(conv_path, chat_data, date_filter, wordlist)
-    
-    dump_dict_to_csv_file(conv_path, 
-        "raw_weekdays_person.csv", raw["A"]["hourofday"]
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_weekdays_person.csv", raw["B"]["hourofday"]
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_months_person.csv", raw["A"]["months"]
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_months_person.csv", raw["B"]["months"]
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_months_chars_person.csv", raw["A"]["months_chars"]
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_months_chars_person.csv", raw["B"]["months_chars"]
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_pictures_person.csv",
-        raw["A"]["monthly_pictures"],
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_pictures_person.csv",
-        raw["B"]["monthly_pictures"],
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_calls_person.csv",
-        raw["A"]["monthly_calls"],
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_calls_person.csv",
-        raw["B"]["monthly_calls"],
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_call_duration_person.csv",
-        raw["A"]["monthly_call_duration"],
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_call_duration_person.csv",
-        raw["B"]["monthly_call_duration"],
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_time_to_reply_person.csv",
-        raw["A"]["monthly_time_to_reply"],
-    )
-    dump_dict_to_csv_file(conv_path, 
-        "raw_monthly_time_to_reply_person.csv",
-        raw["B"]["monthly_time_to_reply"],
+        select = lambda chat: True
+    else:
+        print("input data is a " + format + " chat")
+        select = lambda chat: True
+
+    import _export_cache
+    from _message_table import build_table
+
+    profile = new_profile()
+    with timed(profile, "load") as record:
+        key = cache_key(opts.indir)
+        chat_data, table = None, None
+        if key is not None:
+            chat_data, table = _export_cache.load_chat(opts.cache_dir, key, select)
+        if table is not None:
+            print("using the cached chat")
+            record["cached"] = True
+        else:
+            record["cached"] = False
+            if kind != "full":
+                # the messages of every format go straight into the table
+                chat_data = load_chat(opts.indir, format)
+            elif opts.id is not None:
+                chat_data = select_chat_from_id(opts.indir, opts.id)
+            else:
+                chat_data = select_chat_from_name(opts.indir, opts.name)
+            print("reading messages...")
+            table = build_table(chat_data["messages"])
+            del chat_data["messages"]
+            store_in_cache(key, chat_data, table)
+        record["messages"] = len(table["type"])
+
+    analyze_chat(
+        chat_data,
+        table,
+        date_filter,
+        wordlist,
+        show=opts.show,
+        incremental=opts.incremental,
+        jobs=opts.jobs or os.cpu_count() or 1,
+        date_until=date_until,
+        profile=profile,
     )
 
-    dump_text_results(conv_path, metrics)
-    
     print("done")
 
 